@@ -1 +1,2 @@
-from .locks import SLock
+from .cache import Cache, CacheStats
+from .locks import SLock, KeyedLock
@@ -0,0 +1,207 @@
+import itertools
+import pickle
+import time
+import typing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from threading import RLock
+
+from .fuzzy import FuzzyIndex, extract_many_pickled
+
+
+@dataclass
+class CacheStats:
+    "Counters kept by a Cache, read them with Cache.stats"
+    hits: int = 0
+    misses: int = 0
+    fuzzies: int = 0
+    evictions: int = 0
+
+    @property
+    def ratioHit(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class Cache:
+    """Expiring name -> id cache used by Model.matchFuzzy
+    `data` is the snapshot loaded from the database and lives until the cache expires,
+    learned keys (fuzzy results) are bounded by `size_learned` and evicted least recently used.
+    All methods are thread safe, as the caches are shared at the class level.
+    """
+
+    data: dict = field(default_factory=dict)
+    timeout: float = 60 * 60  # Seconds, None to never expire
+    size_learned: int = 10_000
+
+    learned: OrderedDict = field(default_factory=OrderedDict)
+    stats: CacheStats = field(default_factory=CacheStats)
+    watermark: object = None  # Latest change seen in data, for incremental refreshes
+    timeCreated: float = field(default_factory=time.monotonic)
+    timeRefreshed: float = field(default_factory=time.monotonic)
+
+    _lock: RLock = field(default_factory=RLock, repr=False)
+    _index: FuzzyIndex = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.data = {self.__keytransform__(k): v for k, v in self.data.items()}
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__}(data={len(self.data)} learned={len(self.learned)}"
+            f"{' expired' if self.hasExpired else ''} {self.stats})>"
+        )
+
+    def __keytransform__(self, key):
+        return key.upper() if isinstance(key, str) else key
+
+    def __getitem__(self, key):
+        key = self.__keytransform__(key)
+        with self._lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                try:
+                    value = self.learned[key]
+                except KeyError:
+                    self.stats.misses += 1
+                    raise
+                self.learned.move_to_end(key)
+
+            self.stats.hits += 1
+            return value
+
+    def __contains__(self, key) -> bool:
+        key = self.__keytransform__(key)
+        with self._lock:
+            return key in self.data or key in self.learned
+
+    def __len__(self) -> int:
+        return len(self.data) + len(self.learned)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def getMany(self, keys: typing.Iterable) -> typing.Tuple[dict, list]:
+        "Exact lookups for many keys under one lock, returns ({key: value}, [missing keys])"
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                key = self.__keytransform__(key)
+                if key in self.data:
+                    found[key] = self.data[key]
+                elif key in self.learned:
+                    found[key] = self.learned[key]
+                    self.learned.move_to_end(key)
+                else:
+                    missing.append(key)
+            self.stats.hits += len(found)
+            self.stats.misses += len(missing)
+        return found, missing
+
+    def keys(self) -> list:
+        with self._lock:
+            return [*self.data, *self.learned]
+
+    @property
+    def hasExpired(self) -> bool:
+        return (
+            self.timeout is not None
+            and (time.monotonic() - self.timeRefreshed) > self.timeout
+        )
+
+    def refresh(self, data: dict, watermark=None):
+        """Merge changed names into the snapshot and restart the timeout.
+        Names that failed to match before are forgotten, as they may match a new name now"""
+        with self._lock:
+            for key, value in data.items():
+                key = self.__keytransform__(key)
+                self.data[key] = value
+                self.learned.pop(key, None)
+                if self._index is not None:
+                    self._index.add(key)
+
+            for key in [k for k, v in self.learned.items() if v is None]:
+                del self.learned[key]
+
+            if watermark is not None:
+                self.watermark = watermark
+            self.timeRefreshed = time.monotonic()
+
+    def learnAndReturn(self, key, value):
+        "Remember the result of a fuzzy match for key, and return the value"
+        key = self.__keytransform__(key)
+        with self._lock:
+            self.stats.fuzzies += 1
+            self.learned[key] = value
+            self.learned.move_to_end(key)
+            if self._index is not None and value is not None:
+                self._index.add(key)
+            while len(self.learned) > self.size_learned:
+                key_evicted, _ = self.learned.popitem(last=False)
+                if self._index is not None and key_evicted not in self.data:
+                    self._index.discard(key_evicted)
+                self.stats.evictions += 1
+        return value
+
+    @property
+    def index(self) -> FuzzyIndex:
+        "Trigram index over the known names, built on first use and kept in step by learnAndReturn"
+        with self._lock:
+            if self._index is None:
+                self._index = FuzzyIndex.from_names(
+                    [*self.data, *(k for k, v in self.learned.items() if v is not None)]
+                )
+            return self._index
+
+    def extractOne(
+        self, key, score_cutoff: int = 0
+    ) -> typing.Optional[typing.Tuple[str, int, object]]:
+        "Best (name, score, value) for key from the index, None if nothing reaches score_cutoff"
+        key = self.__keytransform__(key)
+        with self._lock:
+            r = self.index.extractOne(key, score_cutoff=score_cutoff)
+            if r is None:
+                return None
+            name, score = r
+            return (name, score, self.data.get(name, self.learned.get(name)))
+
+    def extractMany(
+        self, keys: typing.List, score_cutoff: int = 0, processes: int = None
+    ) -> typing.List[typing.Optional[typing.Tuple[str, int, object]]]:
+        """extractOne for every key, in order. With processes, the keys are split into one
+        chunk per process and scored against a pickled snapshot of the index"""
+        keys = [self.__keytransform__(key) for key in keys]
+
+        if processes and processes > 1 and len(keys) > 1:
+            with self._lock:
+                index_pickled = pickle.dumps(self.index)
+            size_chunk = -(-len(keys) // processes)
+            chunks = [keys[i : i + size_chunk] for i in range(0, len(keys), size_chunk)]
+            with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as executor:
+                results = list(
+                    itertools.chain.from_iterable(
+                        executor.map(
+                            extract_many_pickled,
+                            itertools.repeat(index_pickled),
+                            chunks,
+                            itertools.repeat(score_cutoff),
+                        )
+                    )
+                )
+        else:
+            with self._lock:
+                results = self.index.extractMany(keys, score_cutoff=score_cutoff)
+
+        with self._lock:
+            return [
+                None
+                if r is None
+                else (r[0], r[1], self.data.get(r[0], self.learned.get(r[0])))
+                for r in results
+            ]
@@ -1,12 +1,19 @@
+import atexit
 import datetime
 import enum
+import functools
 import math
 import os
 import re
+import signal
+import sys
+import time
 import typing
 import warnings
 from collections import defaultdict
 from dataclasses import dataclass, field, fields
+from pathlib import Path
+from queue import Full, Queue
 from statistics import median
 from threading import Lock, RLock, Thread
 from typing import List
@@ -17,6 +24,20 @@ from colorama import Back, Fore, Style
 from . import helpers
 from .locks import SLock
 
+try:
+    import orjson
+
+    def dumps_json(obj) -> bytes:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+except ImportError:
+    import json
+
+    def dumps_json(obj) -> bytes:
+        return json.dumps(obj, default=str).encode()
+
+
 colorama.init(autoreset=True)
 
 COLORS = {
@@ -28,164 +49,492 @@ COLORS = {
 }
 
 
-def getDimentions() -> typing.Tuple[int]:
-    return (int(x) for x in os.popen("stty size", "r").read().split())
+# (rows, columns), read once and refreshed on SIGWINCH
+_DIMENSIONS = None
+DIMENSIONS_DEFAULT = (40, 80)
 
 
-def getRows() -> int:
+def refreshDimentions(*args) -> typing.Tuple[int, int]:
+    "Read the terminal size (also the SIGWINCH handler)"
+    global _DIMENSIONS
     try:
-        return getDimentions()[0]
-    except IndexError:
-        return 40
+        columns, rows = os.get_terminal_size(sys.__stdout__.fileno())
+        _DIMENSIONS = (rows, columns) if rows and columns else DIMENSIONS_DEFAULT
+    except (AttributeError, ValueError, OSError):
+        # Not a terminal (pipe, file, service)
+        _DIMENSIONS = DIMENSIONS_DEFAULT
+    return _DIMENSIONS
+
+
+def getDimentions() -> typing.Tuple[int, int]:
+    return _DIMENSIONS or refreshDimentions()
+
+
+def getRows() -> int:
+    return getDimentions()[0]
 
 
 def getCols() -> int:
+    return getDimentions()[1]
+
+
+def listenDimentions():
+    "Refresh the cached size when the terminal is resized, keeps any previous handler"
+    if not hasattr(signal, "SIGWINCH"):
+        return
+    previous = signal.getsignal(signal.SIGWINCH)
+
+    def on_sigwinch(signum, frame):
+        refreshDimentions()
+        if callable(previous):
+            previous(signum, frame)
+
     try:
-        return getDimentions()[1]
-    except IndexError:
-        return 80
+        signal.signal(signal.SIGWINCH, on_sigwinch)
+    except ValueError:
+        # Only the main thread can set handlers, the size is then read once
+        pass
+
+
+listenDimentions()
 
 
 _LOCK_OUTPUT = RLock()
 
+# Records below the level are dropped before any formatting
+LEVELS = {
+    "info": 10,
+    "good": 20,
+    "important": 30,
+    "caution": 40,
+    "warning": 50,
+    "critical": 60,
+}
 
-def output(
-    message: str,
-    source: object = None,
-    option_prompt: bool = False,
-    option_confirm: bool = False,
-    option_pause: bool = False,
-    end: str = "\n",
-    # fill: str = None,
-    option_line_clear: bool = False,
-    option_timeStamp: bool = True,
-    tag: bool = True,
-    # option_critical: bool = False,
-    # option_warning: bool = False,
-    # option_caution: bool = False,
-    # option_good: bool = False,
-    # option_important: bool = False,
-    option_status: str = None,
-):
-    # if (
-    #     cls in cls.silence or not getattr(cls, "_debug", True)
-    # ) and option_status not in [ConsoleInterfaceStatus.CRITICAL]:
-    #     return
-
-    # if fill == " ":
-    #     option_line_clear = True
-    #     fill = None
-
-    # if option_critical or option_status in ["crit", "critical"]:
-    _color = COLORS.get(
-        (
-            option_status
-            if not isinstance(option_status, str)
-            else option_status.upper()
-        ),
-        Fore.BLUE,
-    )
 
-    try:
-        option_status = option_status.lower()
-    except AttributeError:
-        pass
+@dataclass
+class Record:
+    "An output call, formatted by the writer thread"
 
-    if option_status == "critical":
-        _tagType = f"{_color}!CRIT!"
-    elif option_status == "warning":
-        _tagType = f"{_color}{{{Fore.RESET}WARN{_color}}}"
-    elif option_status == "caution":
-        _tagType = f"{_color}-{Fore.RESET}CAUT{_color}-"
-    elif option_status == "important":
-        _tagType = f"{_color}+{Fore.RESET}IMPT{_color}+"
-    elif option_status == "good":
-        _tagType = f"{_color}({Fore.RESET}GOOD{_color})"
-    elif end == "\r":
-        # Asssume temporary
-        _color = Fore.RESET
-        _tagType = None
-    elif option_prompt or option_pause:
-        _color = COLORS.get("important", Fore.BLUE)
-        _tagType = f"{_color}?{Fore.RESET}PRMT{_color}>"
-    else:
-        _tagType = f"INFO"
+    message: str
+    source: object = None
+    status: str = None
+    end: str = "\n"
+    option_line_clear: bool = False
+    option_timeStamp: bool = True
+    option_prompt: bool = False
+    time: float = field(default_factory=time.time)
+    fields: dict = None  # Structured values, ex: {"user": 3}, kept as is by JSONSink
 
-    _tagLength = 25
-    try:
-        tag = source.__name__
-    except AttributeError:
-        tag = str(source)
+    @property
+    def level(self) -> int:
+        return LEVELS.get(self.status, LEVELS["info"])
+
+    @property
+    def text(self) -> str:
+        "Message with the fields appended as key=value, for people"
+        if not self.fields:
+            return str(self.message)
+        return " ".join(
+            [str(self.message), *(f"{k}={v}" for k, v in self.fields.items())]
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "time": datetime.datetime.fromtimestamp(
+                self.time, datetime.timezone.utc
+            ).isoformat(),
+            "status": self.status or "info",
+            "source": get_tag_name(self.source),
+            "message": str(self.message),
+            "fields": self.fields or {},
+        }
+
+
+TAG_LENGTH = 25
 
-    if len(tag) > _tagLength:
 
-        tagParts = helpers.get_name_terms(tag)
+def get_tag_name(source) -> str:
+    "Name shown in the tag: the class for classes and instances, strings as is"
+    if isinstance(source, str):
+        return source
+    if source is None:
+        return "None"
+    return getattr(source, "__name__", None) or source.__class__.__name__
+
+
+@functools.lru_cache(maxsize=1024)
+def get_tag(name: str, length: int = TAG_LENGTH) -> str:
+    """Name abbreviated to fit the tag, one term at a time from the left,
+    ex: 'HandlerWebsocketDrinkIngredient' -> 'H.W.DrinkIngredient'"""
+    tag = name
+    if len(tag) > length:
+        tagParts = helpers.get_name_terms(name)
+        if "".join(tagParts) != name:
+            # Not CamelCase (ex: snake_case or a repr), the terms would lose characters
+            tagParts = []
         i = 1
-        while len(tag) > _tagLength:
+        while len(tag) > length and i < len(tagParts):
             tag = "".join(
                 [f"{x[0]}." for x in tagParts[:i]] + tagParts[i:]
             )  # Get first letter of each term
+            i += 1
+        # Still too long with every term but the last abbreviated
+        tag = tag[:length]
+    return tag
 
-    _tagClass = (
-        f"{Fore.RESET}[{Fore.MAGENTA}{tag :^{_tagLength}}{Fore.RESET}]" if tag else None
+
+@functools.lru_cache(maxsize=1024)
+def get_tag_class(name: str, option_ansi: bool = True) -> str:
+    "Rendered tag, computed once per source name"
+    fore = Fore if option_ansi else PLAIN
+    tag = get_tag(name)
+    return (
+        f"{fore.RESET}[{fore.MAGENTA}{tag :^{TAG_LENGTH}}{fore.RESET}]" if tag else None
     )
 
-    msg = f" {Fore.RESET}".join(
+
+class _Plain:
+    "Stands in for colorama's Fore when not writing to a terminal, every color is empty"
+
+    def __getattr__(self, name: str) -> str:
+        return ""
+
+
+PLAIN = _Plain()
+
+
+def format_record(record: Record, option_ansi: bool = True) -> str:
+    "Render a record, without any escape sequence when not option_ansi"
+    status, end, source = record.status, record.end, record.source
+    fore = Fore if option_ansi else PLAIN
+
+    _color = (
+        COLORS.get(status.upper() if isinstance(status, str) else status, Fore.BLUE)
+        if option_ansi
+        else ""
+    )
+    if status == "critical":
+        _tagType = f"{_color}!CRIT!"
+    elif status == "warning":
+        _tagType = f"{_color}{{{fore.RESET}WARN{_color}}}"
+    elif status == "caution":
+        _tagType = f"{_color}-{fore.RESET}CAUT{_color}-"
+    elif status == "important":
+        _tagType = f"{_color}+{fore.RESET}IMPT{_color}+"
+    elif status == "good":
+        _tagType = f"{_color}({fore.RESET}GOOD{_color})"
+    elif end == "\r":
+        # Asssume temporary
+        _color = fore.RESET
+        _tagType = None
+    elif record.option_prompt:
+        _color = COLORS.get("important", Fore.BLUE) if option_ansi else ""
+        _tagType = f"{_color}?{fore.RESET}PRMT{_color}>"
+    else:
+        _tagType = f"INFO"
+
+    _tagLength = TAG_LENGTH
+    _tagClass = get_tag_class(get_tag_name(source), option_ansi)
+
+    msg = f" {fore.RESET}".join(
         x
         for x in [
             (
-                f"{Fore.BLACK}({datetime.datetime.now().strftime('%b-%d %H:%M:%S')})"
-                if option_timeStamp
+                f"{fore.BLACK}({time.strftime('%b-%d %H:%M:%S', time.localtime(record.time))})"
+                if record.option_timeStamp
                 else None
             ),
-            f"{Fore.WHITE}{_tagType :^6}" if _tagType else None,
+            f"{fore.WHITE}{_tagType :^6}" if _tagType else None,
             f"{_tagClass}" if _tagClass else None,
-            f"{_color}{message}",
-            Fore.RESET,
+            f"{_color}{record.text}",
+            fore.RESET,
         ]
         if x is not None
     )
-    # cols = cls.getCols()
-    # cols = cols * math.ceil(len(msg) / cols)
-    # if fill:
-    #     msg += fill * int((cols - (len(msg) % cols)) // len(fill))
 
-    if option_line_clear:
+    if end == "\r" and option_ansi:
+        # A progress line that wraps can not be overwritten, keep it within the terminal
+        width = getCols() - 1
+        width -= len(time.strftime("(%b-%d %H:%M:%S) ")) if record.option_timeStamp else 0
+        width -= _tagLength + 3 if _tagClass else 0
+        message = record.text
+        if len(message) > width > 0:
+            msg = msg.replace(message, message[: width - 1] + "…", 1)
+
+    if record.option_line_clear and option_ansi:
         # "Clearline escape sequence"
         msg = "\033[2K" + msg
+    return msg
+
+
+def is_terminal(stream=None) -> bool:
+    stream = stream or sys.stdout
+    return bool(getattr(stream, "isatty", lambda: False)())
+
+
+@dataclass
+class ConsoleSink:
+    "Colored lines for people, plain text when the stream is not a terminal"
+
+    stream: typing.TextIO = None
+    level: int = LEVELS["info"]
+
+    def __post_init__(self):
+        # Checked once, colorama already wraps stdout by now
+        self.option_ansi = is_terminal(self.stream)
+
+    def write(self, record: Record):
+        if record.end == "\r" and not self.option_ansi:
+            # Progress lines only make sense on a terminal
+            return
+        stream = self.stream or sys.stdout
+        with _LOCK_OUTPUT:
+            stream.write(format_record(record, self.option_ansi) + record.end)
+            stream.flush()
+
+    def flush(self):
+        pass
+
+
+@dataclass
+class JSONSink:
+    """One JSON object per line (time, status, source, message, fields) appended to path.
+    The file is rotated once it would grow past size_max: path -> path.1 -> ... path.<backups>.
+    Lines are written unbuffered with O_APPEND, so forked workers can share the file"""
+
+    path: Path
+    size_max: int = 10 * 2 ** 20
+    backups: int = 5
+    level: int = LEVELS["info"]
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        self._fh = None
+        self._size = 0
 
-    # if option_warning:
-    #     warnings.warn(msg)
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "ab", buffering=0)
+        self._size = os.fstat(self._fh.fileno()).st_size
 
-    # Determine color
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
 
-    with _LOCK_OUTPUT:
-        if option_prompt or option_pause:
-            return input(msg)
+    def isCurrent(self) -> bool:
+        "Whether path is still the open file (another worker may have rotated it)"
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._fh.fileno()).st_ino
+        except OSError:
+            return False
 
-        elif option_confirm:
-            tries = 0
-            while True:
-                i = output(
-                    message=f"{message} [Y/n]", option_prompt=True, source=source
+    def rotate(self):
+        self.close()
+        for i in range(self.backups - 1, 0, -1):
+            path = self.path.with_name(f"{self.path.name}.{i}")
+            if path.exists():
+                path.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups and self.path.exists():
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        self.open()
+
+    def write(self, record: Record):
+        line = dumps_json(record.to_dict()) + b"\n"
+        if self._fh is None:
+            self.open()
+        if self._size and self._size + len(line) > self.size_max:
+            if self.isCurrent():
+                self.rotate()
+            else:
+                self.close()
+                self.open()
+        self._fh.write(line)
+        self._size += len(line)
+
+    def flush(self):
+        pass
+
+
+@dataclass
+class ConsoleWriter:
+    """Output backend: records go in a bounded queue and a background thread formats and
+    writes them to every sink, so callers never wait on stdout or a file. When the queue is
+    full the record is dropped and counted, the count is written once the writer catches up."""
+
+    size_queue: int = 10_000
+    level: int = LEVELS["info"]
+    sinks: list = field(default_factory=lambda: [ConsoleSink()])
+
+    dropped: int = 0
+    queue: Queue = field(init=False, repr=False)
+    thread: Thread = field(default=None, init=False, repr=False)
+    pid: int = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.queue = Queue(maxsize=self.size_queue)
+        self._lock = Lock()
+        self._droppedReported = 0
+        if hasattr(os, "register_at_fork"):
+            # Threads do not survive a fork (AppWeb.serve with workers), start over in the child
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self._lock = Lock()
+        self.queue = Queue(maxsize=self.size_queue)
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        with self._lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = Thread(target=self.run, name="console", daemon=True)
+                self.thread.start()
+
+    def submit(self, record: Record):
+        if record.level < self.level:
+            return
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        queue = self.queue
+        while True:
+            record = queue.get()
+            try:
+                self.write(record)
+                if queue.empty():
+                    [sink.flush() for sink in self.sinks]
+            finally:
+                queue.task_done()
+
+    def write(self, record: Record):
+        if self.dropped > self._droppedReported:
+            lost, self._droppedReported = self.dropped - self._droppedReported, self.dropped
+            self.emit(
+                Record(
+                    message="Records dropped, output queue full",
+                    source=self.__class__.__name__,
+                    status="caution",
+                    fields={"dropped": lost},
                 )
-                if i == "Y":
-                    return True
-                elif i == "n":
-                    return False
-                else:
-                    output(
-                        message=f"{i !r} not a valid response, try again.",
-                        option_caution=True,
-                        source=source,
-                    )
-                tries += 1
-                if tries >= 2:
-                    output(
-                        message="Tries exceeded, quitting",
-                        option_warning=True,
-                        source=source,
-                    )
-                    break
-        else:
-            print(msg, end=end)
+            )
+        self.emit(record)
+
+    def emit(self, record: Record):
+        for sink in self.sinks:
+            if record.level < sink.level:
+                continue
+            try:
+                sink.write(record)
+            except Exception as e:
+                # A broken sink must not stop the writer (or the other sinks)
+                print(f"{sink !r} failed: {e !r}", file=sys.__stderr__)
+
+    def add_sink(self, sink):
+        self.sinks = [*self.sinks, sink]
+
+    def remove_sink(self, sink):
+        self.sinks = [x for x in self.sinks if x is not sink]
+
+    def flush(self):
+        "Wait until everything submitted is written"
+        if self.thread is not None and self.pid == os.getpid():
+            self.queue.join()
+
+
+WRITER = ConsoleWriter()
+atexit.register(WRITER.flush)
+
+
+def set_level(status: str):
+    "Only output records at least as important as status, ex: set_level('caution')"
+    WRITER.level = LEVELS[status.lower()]
+
+
+def configure(level: str = None, json: dict = None):
+    """Set up from the "console" section of config.yaml, ex:
+    console: {level: caution, json: {path: logs/bartech.jsonl, size_max: 10485760}}"""
+    if level:
+        set_level(level)
+    if json and json.get("path"):
+        WRITER.add_sink(JSONSink(**json))
+
+
+def output(
+    message: str,
+    source: object = None,
+    option_prompt: bool = False,
+    option_confirm: bool = False,
+    option_pause: bool = False,
+    end: str = "\n",
+    # fill: str = None,
+    option_line_clear: bool = False,
+    option_timeStamp: bool = True,
+    tag: bool = True,
+    option_status: str = None,
+    fields: dict = None,
+):
+    """Hand a record to the writer thread, prompts are answered synchronously.
+    fields are structured values for the sinks, ex: fields={"user": user.id}"""
+    try:
+        option_status = option_status.lower()
+    except AttributeError:
+        pass
+
+    if option_prompt or option_pause:
+        WRITER.flush()
+        record = Record(
+            message=message,
+            source=source,
+            status=option_status,
+            end=end,
+            option_line_clear=option_line_clear,
+            option_timeStamp=option_timeStamp,
+            option_prompt=True,
+            fields=fields,
+        )
+        with _LOCK_OUTPUT:
+            return input(format_record(record, is_terminal()))
+
+    elif option_confirm:
+        tries = 0
+        while True:
+            i = output(message=f"{message} [Y/n]", option_prompt=True, source=source)
+            if i == "Y":
+                return True
+            elif i == "n":
+                return False
+            else:
+                output(
+                    message=f"{i !r} not a valid response, try again.",
+                    option_status="CAUTION",
+                    source=source,
+                )
+            tries += 1
+            if tries >= 2:
+                output(
+                    message="Tries exceeded, quitting",
+                    option_status="WARNING",
+                    source=source,
+                )
+                break
+
+    else:
+        WRITER.submit(
+            Record(
+                message=message,
+                source=source,
+                status=option_status,
+                end=end,
+                option_line_clear=option_line_clear,
+                option_timeStamp=option_timeStamp,
+                fields=fields,
+            )
+        )
@@ -1,5 +1,6 @@
 from pathlib import Path
 
 PATH_DATA_RAW = Path() / "data" / "raw"
+PATH_CACHE = Path() / ".cache"
 
 REGEX_NAME_TERMS = r"(?:(?<=[a-zA-Z])|(?<=^))([A-Z]+|[A-Z][a-z]+)(?:(?=[A-Z])|(?=$))"
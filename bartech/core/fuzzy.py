@@ -0,0 +1,102 @@
+"Trigram candidate index, so fuzzy matching only scores names that share text with the key"
+import pickle
+import typing
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from fuzzywuzzy import fuzz, utils
+
+
+def get_trigrams(text: str) -> typing.FrozenSet[str]:
+    "Padded trigrams of the processed text, so short names and word starts still have grams"
+    text = f"  {text} "
+    return frozenset(text[i : i + 3] for i in range(len(text) - 2))
+
+
+@dataclass
+class FuzzyIndex:
+    """Inverted trigram index over names.
+    extractOne shortlists the names sharing the most trigrams with the key (Dice coefficient)
+    and only runs the full fuzzywuzzy WRatio scoring on that shortlist.
+    """
+
+    size_shortlist: int = 32
+    similarity_min: float = 0.15  # Dice coefficient below which a candidate is dropped
+
+    grams: typing.DefaultDict[str, set] = field(
+        default_factory=lambda: defaultdict(set), repr=False
+    )
+    names: typing.Dict[str, typing.FrozenSet[str]] = field(
+        default_factory=dict, repr=False
+    )
+
+    @classmethod
+    def from_names(cls, names: typing.Iterable[str], **kwargs) -> "FuzzyIndex":
+        index = cls(**kwargs)
+        [index.add(name) for name in names]
+        return index
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}(names={len(self.names)} grams={len(self.grams)})>"
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name) -> bool:
+        return name in self.names
+
+    def add(self, name: str):
+        if not isinstance(name, str) or name in self.names:
+            return
+        grams = get_trigrams(utils.full_process(name))
+        self.names[name] = grams
+        for gram in grams:
+            self.grams[gram].add(name)
+
+    def discard(self, name: str):
+        grams = self.names.pop(name, None)
+        for gram in grams or []:
+            self.grams[gram].discard(name)
+            if not self.grams[gram]:
+                del self.grams[gram]
+
+    def shortlist(self, key: str) -> typing.List[str]:
+        "Names most likely to match key, best first"
+        grams = get_trigrams(utils.full_process(key))
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.grams.get(gram, ()))
+
+        final = []
+        for name, count in counts.most_common():
+            similarity = 2 * count / (len(grams) + len(self.names[name]))
+            if similarity >= self.similarity_min:
+                final.append(name)
+                if len(final) >= self.size_shortlist:
+                    break
+        return final
+
+    def extractOne(
+        self, key: str, score_cutoff: int = 0
+    ) -> typing.Optional[typing.Tuple[str, int]]:
+        "Same contract as fuzzywuzzy.process.extractOne, (name, score) or None below score_cutoff"
+        best = None
+        for name in self.shortlist(key):
+            score = fuzz.WRatio(key, name)
+            if score >= score_cutoff and (best is None or score > best[1]):
+                best = (name, score)
+                if score == 100:
+                    break
+        return best
+
+    def extractMany(
+        self, keys: typing.Iterable[str], score_cutoff: int = 0
+    ) -> typing.List[typing.Optional[typing.Tuple[str, int]]]:
+        return [self.extractOne(key, score_cutoff=score_cutoff) for key in keys]
+
+
+def extract_many_pickled(
+    index_pickled: bytes, keys: typing.List[str], score_cutoff: int = 0
+) -> typing.List[typing.Optional[typing.Tuple[str, int]]]:
+    "Process pool entry point, the index is sent pickled so each chunk gets a consistent snapshot"
+    return pickle.loads(index_pickled).extractMany(keys, score_cutoff=score_cutoff)
@@ -1,4 +1,6 @@
 "Static methods that may be used throughout the codebase"
+import functools
+import itertools
 import re
 import typing
 from .constants import REGEX_NAME_TERMS
@@ -29,6 +31,16 @@ def reduceSmallToZero(num: float):
         return 0 if abs(num) <= 1e-5 else num
 
 
+def chunked(values: typing.Iterable, size: int) -> typing.Iterator[list]:
+    "Lists of at most size values, ex: to keep IN clauses under the database's parameter limit"
+    values = iter(values)
+    while True:
+        chunk = list(itertools.islice(values, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def rowStandardize(row):
     "Standardizes row to be able to be used via dict methods"
     if isinstance(row, dict):
@@ -45,9 +57,17 @@ def get_name_terms(obj) -> typing.List[str]:
     else:
         raise AssertionError(f"{obj !r} is not a string or class")
 
-    return list(re.findall(REGEX_NAME_TERMS, str(_name)))
+    # Copy, callers are free to change their list
+    return list(_get_name_terms(str(_name)))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_name_terms(name: str) -> typing.Tuple[str]:
+    "Memoized regex split, class names are a small fixed set"
+    return tuple(re.findall(REGEX_NAME_TERMS, name))
 
 
+@functools.lru_cache(maxsize=None)
 def get_name_related(source, relative, option_snake_case=True) -> str:
     """
     How is source related to relative?
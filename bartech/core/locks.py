@@ -1,6 +1,7 @@
 from collections import defaultdict
 from dataclasses import dataclass, field, fields
 from threading import Lock, RLock
+from typing import List
 
 
 @dataclass()
@@ -91,3 +92,100 @@ class SLock:
 
     def __keytransform__(self, key):
         return key
+
+
+@dataclass
+class KeyedLockEntry:
+    "Reference counted lock owned by a KeyedLock stripe"
+    lock: RLock = field(default_factory=RLock)
+    refs: int = 0
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}(refs={self.refs})>"
+
+
+@dataclass
+class KeyedLockHandle:
+    """Context manager for one key of a KeyedLock, returned by KeyedLock.__getitem__
+    The entry is only referenced between acquire and release, so handles that are never
+    entered do not keep anything alive"""
+
+    parent: "KeyedLock"
+    key: object
+
+    def __enter__(self, *args, **kwargs):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.release()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self.parent.acquire(self.key, blocking=blocking, timeout=timeout)
+
+    def release(self):
+        self.parent.release(self.key)
+
+
+@dataclass
+class KeyedLock:
+    """Drop-in replacement for SLock with the same `with lock[key]:` API.
+    Keys are spread over `stripes` independent maps, each guarded by its own lock, and
+    entries are reference counted so the final release removes them (no sweeping).
+    Acquiring a key is O(1) and only contends with keys hashed to the same stripe.
+    """
+
+    stripes: int = 64
+    _stripes: List = field(init=False, repr=False)
+
+    def __post_init__(self):
+        assert self.stripes > 0
+        self._stripes = [(Lock(), dict()) for _ in range(self.stripes)]
+
+    def __getitem__(self, key) -> KeyedLockHandle:
+        return KeyedLockHandle(parent=self, key=self.__keytransform__(key))
+
+    def __len__(self) -> int:
+        "Number of keys currently held or waited on"
+        return sum(len(entries) for _, entries in self._stripes)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}(stripes={self.stripes} keys={len(self)})>"
+
+    def __keytransform__(self, key):
+        return key
+
+    def _stripe(self, key) -> tuple:
+        return self._stripes[hash(key) % self.stripes]
+
+    def acquire(self, key, blocking: bool = True, timeout: float = -1) -> bool:
+        lock_stripe, entries = self._stripe(key)
+        with lock_stripe:
+            try:
+                entry = entries[key]
+            except KeyError:
+                entry = entries[key] = KeyedLockEntry()
+            entry.refs += 1
+
+        # Wait outside of the stripe lock so other keys are never blocked ->
+        if entry.lock.acquire(blocking, timeout):
+            return True
+
+        # Not acquired (non-blocking or timed out), give the reference back
+        self._unref(key, entry)
+        return False
+
+    def release(self, key):
+        lock_stripe, entries = self._stripe(key)
+        with lock_stripe:
+            entry = entries[key]
+        entry.lock.release()
+        self._unref(key, entry)
+
+    def _unref(self, key, entry: KeyedLockEntry):
+        lock_stripe, entries = self._stripe(key)
+        with lock_stripe:
+            entry.refs -= 1
+            assert entry.refs >= 0
+            if entry.refs == 0:
+                del entries[key]
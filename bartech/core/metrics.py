@@ -0,0 +1,197 @@
+"Request and database query metrics, rendered in the Prometheus text format for /metrics"
+import bisect
+import re
+import typing
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+
+from .console import output
+
+BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+@dataclass
+class Histogram:
+    "Counts per bucket (upper bounds), cumulated when rendered"
+
+    buckets: typing.Tuple[float] = BUCKETS_SECONDS
+    counts: typing.List[int] = field(default=None, init=False)
+    total: float = 0.0
+    count: int = 0
+
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def __post_init__(self):
+        # Last slot is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def lines(self, name: str, labels: dict) -> typing.Iterator[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        cumulated = 0
+        for bound, n in zip([*self.buckets, "+Inf"], counts):
+            cumulated += n
+            yield f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulated}"
+        yield f"{name}_sum{format_labels(labels)} {total}"
+        yield f"{name}_count{format_labels(labels)} {count}"
+
+
+@dataclass
+class RequestStats:
+    """Queries of one request, filled by the engine events of every Source.
+    Statements are counted by their SQL text (parameters left out), so the same
+    lazy load run for each row of a loop shows up as one statement repeated"""
+
+    handler: str
+    queries: int = 0
+    seconds: float = 0.0
+    statements: typing.Counter[str] = field(default_factory=Counter)
+
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def add(self, statement: str, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+
+    def get_repeated(self, threshold: int) -> typing.List[typing.Tuple[str, int]]:
+        "Statements run at least threshold times, the N+1 suspects"
+        return [(s, n) for s, n in self.statements.most_common() if n >= threshold]
+
+
+# Stats of the request being handled, set by HandlerPage.prepare.
+# Source.run copies the context to its threads so their queries are counted too
+REQUEST_STATS: ContextVar = ContextVar("REQUEST_STATS", default=None)
+
+
+@dataclass
+class Metrics:
+    """Registry of the application's metrics.
+    NOTE: Each worker forked by AppWeb.serve keeps its own, a scrape sees one of them"""
+
+    prefix: str = "bartech"
+    threshold_repeated: int = 10  # Same statement this many times in a request -> N+1
+
+    requests: typing.DefaultDict[tuple, int] = field(
+        default_factory=lambda: defaultdict(int)
+    )
+    latency: typing.DefaultDict[tuple, Histogram] = field(
+        default_factory=lambda: defaultdict(Histogram)
+    )
+    queriesPerRequest: typing.DefaultDict[tuple, Histogram] = field(
+        default_factory=lambda: defaultdict(lambda: Histogram(BUCKETS_QUERIES))
+    )
+    querySecondsPerRequest: typing.DefaultDict[tuple, Histogram] = field(
+        default_factory=lambda: defaultdict(Histogram)
+    )
+    queries: typing.DefaultDict[tuple, Histogram] = field(
+        default_factory=lambda: defaultdict(Histogram)
+    )
+    repeated: typing.DefaultDict[tuple, int] = field(
+        default_factory=lambda: defaultdict(int)
+    )
+
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def observe_query(self, source: str, seconds: float):
+        "Every query of a Source, in or outside of a request"
+        self.queries[(source,)].observe(seconds)
+
+    def observe_request(
+        self, handler: str, method: str, status: int, seconds: float, stats: RequestStats
+    ):
+        with self._lock:
+            self.requests[(handler, method, status)] += 1
+        self.latency[(handler, method)].observe(seconds)
+        if stats is None:
+            return
+
+        self.queriesPerRequest[(handler,)].observe(stats.queries)
+        self.querySecondsPerRequest[(handler,)].observe(stats.seconds)
+        for statement, count in stats.get_repeated(self.threshold_repeated):
+            with self._lock:
+                self.repeated[(handler,)] += 1
+            output(
+                source=self,
+                message="Same statement repeated in one request, N+1 queries?",
+                option_status="CAUTION",
+                fields={
+                    "handler": handler,
+                    "count": count,
+                    "statement": re.sub(r"\s+", " ", statement)[:200],
+                },
+            )
+
+    def render(self) -> str:
+        "Prometheus text exposition format"
+        p = self.prefix
+        lines = []
+
+        def histograms(name: str, help: str, histograms: dict, names: tuple):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} histogram"])
+            for key, histogram in list(histograms.items()):
+                lines.extend(histogram.lines(name, dict(zip(names, key))))
+
+        def counters(name: str, help: str, counters: dict, names: tuple):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} counter"])
+            for key, value in list(counters.items()):
+                lines.append(f"{name}{format_labels(dict(zip(names, key)))} {value}")
+
+        counters(
+            f"{p}_requests_total",
+            "Requests handled",
+            self.requests,
+            ("handler", "method", "status"),
+        )
+        histograms(
+            f"{p}_request_seconds",
+            "Request latency",
+            self.latency,
+            ("handler", "method"),
+        )
+        histograms(
+            f"{p}_request_queries",
+            "Database queries per request",
+            self.queriesPerRequest,
+            ("handler",),
+        )
+        histograms(
+            f"{p}_request_query_seconds",
+            "Time spent in database queries per request",
+            self.querySecondsPerRequest,
+            ("handler",),
+        )
+        counters(
+            f"{p}_request_repeated_statements_total",
+            f"Statements run {self.threshold_repeated}+ times in one request (N+1 suspects)",
+            self.repeated,
+            ("handler",),
+        )
+        histograms(
+            f"{p}_query_seconds", "Database query duration", self.queries, ("source",)
+        )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
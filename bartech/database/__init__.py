@@ -1,9 +1,14 @@
+import os
+
 from .base import Base
 from .binder import Binder, Relator, accessible
+from .datafy import Datafy
 from .models import *
 from .sources import Source
 from .commands import commands
 
 
 # XXX -> BIND THE MODELS
-Binder(modelBase=Base).bind(option_verbose=True)
+# Quiet unless BARTECH_VERBOSE is set, binderBase.report() has the startup timings
+binderBase = Binder(modelBase=Base)
+binderBase.bind(option_verbose=bool(os.environ.get("BARTECH_VERBOSE")))
@@ -46,11 +46,12 @@ from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.sql import func, select, text
 from sqlalchemy.sql.expression import case, cast
 
-from creature.core.console import output
-from creature.core.locks import SLock
-
-from ..core.helpers import get_name_related
-from .binder import Binder, Relator, accessible
+from ..core.cache import Cache
+from ..core.console import output
+from ..core.helpers import chunked, get_name_related
+from ..core.locks import KeyedLock
+from .binder import Binder, Relator, accessible, get_accessibles
+from .datafy import Datafy
 from .sources import Source
 
 
@@ -65,6 +66,21 @@ class Model:
     _related = []
     _indexed = []
     # _caches = {}
+    _datafyDepth = 1  # Relations nested by toDict/datafy, see DatafyPlan
+
+    _matchFuzzyThreshold = 80
+    _cacheTimeout = 60 * 60
+    _cacheRefreshFull = 24 * 60 * 60
+    # now() is the transaction start, rows committed late can be stamped before the watermark
+    _cacheWatermarkLag = datetime.timedelta(minutes=5)
+    _cacheSizeLearned = 10_000
+    # Bound parameters per IN query, SQLite allows at most 999
+    _sizeIn = 500
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Registry of the @accessible functions, read by BinderSlave.setAccessibles
+        cls._accessibles = get_accessibles(cls)
 
     @classmethod
     def __class_init_pre__(cls):
@@ -73,17 +89,23 @@ class Model:
         USE THIS METHOD VERY CAREFULLY"""
         # Method called in binder
         cls._lock_get_or_create = Lock()
-        cls._sLock_get_or_create = SLock()
+        cls._sLock_get_or_create = KeyedLock()
         cls._lock_bounty = Lock()
         # ^ This lock is not necessary because get or create is always called
         # in the bounty, so therefore, worst case, the object would be updated
         # with the same values
         cls._caches = dict()
+        cls._lock_caches = Lock()
 
     @classmethod
     def __class_init__(cls):
         "Method for abstraction, is called after pre and can be defined for specific classes"
 
+    @classmethod
+    def output(cls, message: str, **kwargs):
+        "console.output tagged with the model"
+        return output(message=message, source=cls, **kwargs)
+
     @declared_attr
     def __tablename__(cls):
         return cls.__name__
@@ -138,6 +160,18 @@ class Model:
             )
         ]
 
+    @classmethod
+    def getFilterKeys(cls) -> List[List[str]]:
+        "Column names of each primary key and unique constraint, every one identifies a row"
+        return sorted(
+            (
+                [column.name for column in x.columns]
+                for x in cls.__table__.constraints
+                if isinstance(x, (PrimaryKeyConstraint, UniqueConstraint))
+            ),
+            key=lambda names: (len(names), names),
+        )
+
     @classmethod
     def get_or_create(
         cls,
@@ -172,12 +206,13 @@ class Model:
                         raise
                     else:
                         cls.output(
-                            f"Assuming that separate process is trying to commit object with filters {filters}",
+                            "Assuming that separate process is trying to commit object",
                             option_status="IMPORTANT",
+                            fields={"filters": filters},
                         )
                         # This means that a separate process is trying to do the same thing
                         # SOLUTION -> retry the method
-                        return cls.get_or_create_magic(
+                        return cls.get_or_create(
                             requestor=requestor,
                             filters=filters,
                             updates=updates,
@@ -186,7 +221,9 @@ class Model:
 
             except MultipleResultsFound:
                 cls.output(
-                    f"Multiple found for filters:{filters}", option_status="CRITICAL"
+                    "Multiple found for filters",
+                    option_status="CRITICAL",
+                    fields={"filters": filters},
                 )
                 raise
 
@@ -212,106 +249,230 @@ class Model:
         return instance
 
     @classmethod
-    def createAll(cls, session) -> list:
+    async def get_or_create_async(
+        cls, requestor: Source, filters: dict, updates: dict = {}
+    ):
+        "get_or_create that can be awaited from the IOLoop, requestor has to be a Source"
+        return await requestor.run(
+            lambda session: cls.get_or_create(session, filters=filters, updates=updates)
+        )
+
+    @classmethod
+    async def query_async(cls, requestor: Source, *criterion) -> list:
+        "All records matching the criterion, awaitable from the IOLoop"
+        return await requestor.run(
+            lambda session: session.query(cls).filter(*criterion).all()
+        )
+
+    @classmethod
+    def get_or_create_many(
+        cls,
+        requestor: Source,
+        list_filters: List[dict],
+        updates: dict = {},
+        size_chunk: int = 500,
+    ) -> list:
+        """Batched get_or_create, returns the instances in the order of list_filters.
+        Rows are keyed by the columns of one whole primary key or unique constraint
+        (see getFilterKeys) that every filter has, and each chunk costs one SELECT, at most one INSERT plus a SELECT for the new rows,
+        one UPDATE and one commit."""
+        if not list_filters:
+            return []
+
+        # A single column of a composite constraint does not identify a row ->
+        terms = next(
+            (
+                names
+                for names in cls.getFilterKeys()
+                if all(name in filters for filters in list_filters for name in names)
+            ),
+            None,
+        )
+        if not terms:
+            raise Exception(
+                f"Every filter for {cls.__name__} needs all the columns of one of {cls.getFilterKeys()}"
+            )
+
+        # Different filters with the same key resolve to the same row ->
+        keys = [tuple(filters[term] for term in terms) for filters in list_filters]
+        filtersByKey = dict(zip(keys, list_filters))
+        keysUnique = list(filtersByKey)
+
+        # Query.session works for both a Source and a bare Session
+        session = requestor.query(cls).session
+
+        instances = {}
+        for i in range(0, len(keysUnique), size_chunk):
+            chunk = keysUnique[i : i + size_chunk]
+            found = cls._get_many_by_keys(session, terms, chunk)
+
+            missing = [key for key in chunk if key not in found]
+            if missing:
+                cls._insert_many(session, [filtersByKey[key] for key in missing])
+                found.update(cls._get_many_by_keys(session, terms, missing))
+
+            if updates:
+                cls._update_many(session, list(found.values()), updates)
+
+            session.commit()
+            instances.update(found)
+
+        # None where a row could not be created (conflict on another unique constraint)
+        return [instances.get(key) for key in keys]
+
+    @classmethod
+    def _get_many_by_keys(cls, session, terms: List[str], keys: list) -> dict:
+        "One SELECT per _sizeIn bound parameters of keys, returns {key: instance}"
+        columns = [getattr(cls, term) for term in terms]
+        found = {}
+        for chunk in chunked(keys, max(1, cls._sizeIn // len(columns))):
+            if len(columns) == 1:
+                clause = columns[0].in_([key[0] for key in chunk])
+            else:
+                clause = sa.tuple_(*columns).in_(chunk)
+            for instance in session.query(cls).filter(clause):
+                found[tuple(getattr(instance, term) for term in terms)] = instance
+        return found
+
+    @classmethod
+    def _insert_many(cls, session, rows: List[dict]):
+        "Insert rows, skipping the ones that already exist (inserted by another process)"
+        columns = set(cls.__table__.columns.keys())
+
+        if session.get_bind().dialect.name == "postgresql" and all(
+            set(row) <= columns for row in rows
+        ):
+            from sqlalchemy.dialects.postgresql import insert
+
+            # Multi-row VALUES needs the same columns in every row ->
+            for _, group in itertools.groupby(
+                sorted(rows, key=lambda row: sorted(row)), key=lambda row: sorted(row)
+            ):
+                session.execute(
+                    insert(cls.__table__).values(list(group)).on_conflict_do_nothing()
+                )
+            return
+
+        # Fallback: insert them all in one flush, and only go row by row on a conflict
+        try:
+            with session.begin_nested():
+                session.add_all([cls(**row) for row in rows])
+        except sqlalchemy.exc.IntegrityError:
+            output(
+                source=cls,
+                message=f"Conflict inserting {len(rows)} rows, retrying one by one",
+                option_status="IMPORTANT",
+            )
+            for row in rows:
+                try:
+                    with session.begin_nested():
+                        session.add(cls(**row))
+                except sqlalchemy.exc.IntegrityError:
+                    pass
+
+    @classmethod
+    def _update_many(cls, session, instances: list, updates: dict):
+        "Apply get_or_create style updates, in one UPDATE unless a callable needs the instance"
+        if any(callable(val) for val in updates.values()):
+            for instance in instances:
+                for key, val in updates.items():
+                    setattr(instance, key, val(instance) if callable(val) else val)
+            session.flush()
+        else:
+            # Instances are expired by the commit that follows, no need to synchronize
+            for chunk in chunked([instance.id for instance in instances], cls._sizeIn):
+                session.query(cls).filter(cls.id.in_(chunk)).update(
+                    updates, synchronize_session=False
+                )
+
+    @classmethod
+    def getDataPlan(cls) -> List[tuple]:
+        """_data_header resolved once per class into (index, attribute name, reference).
+        reference is None for plain columns, and (model, column name) for "Model column"
+        headers (ex: "Ingredient name"), whose cells are looked up in that model"""
+        try:
+            return cls._dataPlan
+        except AttributeError:
+            pass
+
+        plan = []
+        for i, header in enumerate(getattr(cls, "_data_header", [])):
+            terms = header.split(" ") if isinstance(header, str) else None
+            if not terms or len(terms) > 2:
+                raise Exception(
+                    f"Header {header !r} on {cls.__name__} has to be 'column' or 'Model column'"
+                )
+            if len(terms) == 1:
+                plan.append((i, header, None))
+                continue
+
+            try:
+                """Try to get the class by the term
+                (has to have uppercase first letter)"""
+                model = cls._decl_class_registry[terms[0]]
+                name = get_name_related(source=cls, relative=model)
+            except KeyError:
+                """Assume that the term refers to a Relator object"""
+                relators = [r for r in cls._binder.relators if r.name_alt == terms[0]]
+                if not relators:
+                    raise Exception(
+                        f"Could not find model for {terms[0]} in {cls.__name__} header {header !r}"
+                    )
+                model = relators[0]._model_target
+                name = terms[0]
+
+            plan.append((i, name, (model, terms[1])))
+
+        cls._dataPlan = plan
+        return plan
+
+    @classmethod
+    def createAll(cls, session, size_chunk: int = None) -> list:
+        """Create the records of _data, committing every size_chunk rows if given.
+        Referenced records are fetched with IN queries per referenced model/column,
+        one per _sizeIn distinct values, not one per row"""
         final = []
         output(message="CREATING", source=cls)
-        for row in cls._data:
-            rowDict = {
-                cls._data_header[i]: row[i]
-                for i in range(min(len(row), len(cls._data_header)))
-                if " " not in cls._data_header[i]
-            }
-
-            c = cls(**rowDict)
+        plan = cls.getDataPlan()
+
+        lookups = collections.defaultdict(set)
+        for i, name, reference in plan:
+            if reference is not None:
+                lookups[reference].update(row[i] for row in cls._data if i < len(row))
+
+        found = {}
+        for (model, column), values in lookups.items():
+            found[(model, column)] = byValue = {}
+            for chunk in chunked(values, cls._sizeIn):
+                for x in session.query(model).filter(getattr(model, column).in_(chunk)):
+                    value = getattr(x, column)
+                    if value in byValue:
+                        # Same as the one .one() per row raised before the prefetch
+                        raise MultipleResultsFound(
+                            f"Multiple {model.__name__} with {column}={value !r}"
+                        )
+                    byValue[value] = x
 
-            def getDataHeaderAttribute(header, val) -> (str, Base):
-                if " " in header:
-                    terms = header.split(" ")
-                    try:
-                        assert len(terms) == 2
-                    except AssertionError:
-                        print(terms)
-                        raise
+        for row in cls._data:
+            c = cls(
+                **{
+                    name: row[i]
+                    for i, name, reference in plan
+                    if reference is None and i < len(row)
+                }
+            )
 
+            for i, name, reference in plan:
+                if reference is not None and i < len(row):
                     try:
-                        """Try to get the class by the term
-                        (has to have uppercase first letter)"""
-                        model = cls._decl_class_registry[terms[0]]
-                        name = get_name_related(source=cls, relative=model)
+                        setattr(c, name, found[reference][row[i]])
                     except KeyError:
-                        """Assume that the term refers to a Relator object"""
-                        model = None
-                        all = []
-                        for r in cls._metallurgy.allRelators():
-                            all.append(r)
-                            if r.nameAlt == terms[0]:
-                                model = r.x
-                        if not model:
-                            print(all)
-                            # raise Exception("Could not find model for {} on row {}".format(
-                            #     terms[0]), row)
-                            raise
-                        name = terms[0]
-
-                    query = session.query(model).filter(
-                        getattr(model, terms[1]) == row[i]
-                    )
-                    try:
-                        return (name, query.one())
-                    except sqlalchemy.orm.exc.NoResultFound:
-                        print(query.statement)
-                        # print(row)
-                        print(terms[1])
-                        raise
-
-            for i in range(min(len(row), len(cls._data_header))):
-                if isinstance(cls._data_header[i], list):
-                    "Composite (multi-component) attribute"
-                    # TODO
-                    raise
-
-                    # setattr(c, name, query.one())
-                if " " in cls._data_header[i]:
-                    setattr(c, *getDataHeaderAttribute(cls._data_header[i], row[i]))
-
-                # if " " in cls._data_header[i] and False:
-                #     terms = cls._data_header[i].split(" ")
-                #     try:
-                #         assert(len(terms) == 2)
-                #     except AssertionError:
-                #         print(terms)
-                #         raise
-                #
-                #     try:
-                #         """Try to get the class by the term
-                #         (has to have uppercase first letter)"""
-                #         model = cls._decl_class_registry[terms[0]]
-                #         name = cls.get_name_related(model)
-                #     except KeyError:
-                #         """Assume that the term refers to a Relator object"""
-                #         model = None
-                #         all = []
-                #         for r in cls._metallurgy.allRelators():
-                #             all.append(r)
-                #             if r.nameAlt == terms[0]:
-                #                 model = r.x
-                #         if not model:
-                #             print(all)
-                #             raise Exception("Could not find model for {} on row {}".format(
-                #                 terms[0]), row)
-                #         name = terms[0]
-                #
-                #     query = session.query(model).filter(
-                #         getattr(model, terms[1]) == row[i]
-                #     )
-                #     try:
-                #         setattr(c, name, query.one())
-                #     except sqlalchemy.orm.exc.NoResultFound:
-                #         print(query.statement)
-                #         print(row)
-                #         print(terms[1])
-                #         raise
-                #
+                        output(
+                            source=cls,
+                            message=f"No {reference[0].__name__} with {reference[1]}={row[i] !r} for row {row}",
+                            option_status="CRITICAL",
+                        )
+                        raise NoResultFound()
 
             try:
                 session.add(c)
@@ -321,6 +482,9 @@ class Model:
             else:
                 final.append(c)
 
+            if size_chunk and len(final) % size_chunk == 0:
+                session.commit()
+
         session.flush()
         session.commit()
 
@@ -367,20 +531,131 @@ class Model:
         return iterate()
 
     @classmethod
-    def getCacheNames(cls, caveat=None, requestor: Source = None) -> dict:
+    def getModelsNameAlt(cls) -> List[tuple]:
+        """Alternate name tables of this model as (model, column relating it to cls.id)
+        Ex: Drink -> [(DrinkNameAlt, DrinkNameAlt.drinkId)]"""
+        final = []
+        for model in cls._decl_class_registry.values():
+            if (
+                not hasattr(model, "__table__")
+                or model is cls
+                or "name" not in model.__table__.columns
+                or get_name_related(source=cls, relative=model) != "nameAlt"
+            ):
+                continue
+            for relator in model._binder.relators:
+                if relator.target is cls:
+                    final.append((model, getattr(model, relator.idAttributeName)))
+        return final
+
+    @classmethod
+    def queryCacheNames(cls, requestor: Source, caveat=None, since=None) -> list:
+        """Rows of (id, name, timeUpdated) for every name of every record, in one statement.
+        Only the id/name columns are selected, alternate names come from one join each.
+        With since, only rows updated at or after it are returned (models without
+        TimeStamped always return everything)."""
+        selects = []
+
+        def stamp(model):
+            try:
+                return model.timeUpdated.label("timeUpdated")
+            except AttributeError:
+                return cast(sa.null(), DateTime).label("timeUpdated")
+
+        def restrict(query, model):
+            if caveat is not None:
+                query = query.where(caveat)
+            if since is not None and hasattr(model, "timeUpdated"):
+                query = query.where(model.timeUpdated >= since)
+            return query
+
+        for propname in ["name", "abbreviation"]:
+            if propname in cls.__table__.columns:
+                column = getattr(cls, propname)
+                selects.append(
+                    restrict(
+                        select(
+                            [cls.id.label("id"), column.label("name"), stamp(cls)]
+                        ).where(column.isnot(None)),
+                        cls,
+                    )
+                )
+
+        for model, column in cls.getModelsNameAlt():
+            selects.append(
+                restrict(
+                    select(
+                        [column.label("id"), model.name.label("name"), stamp(model)]
+                    ).select_from(model.__table__.join(cls.__table__, column == cls.id)),
+                    model,
+                )
+            )
+
+        if not selects:
+            return []
+
+        return (
+            requestor.query(cls)
+            .session.execute(selects[0] if len(selects) == 1 else sa.union_all(*selects))
+            .fetchall()
+        )
+
+    @classmethod
+    def getCacheNames(cls, caveat=None, requestor: Source = None, since=None) -> dict:
+        "Return dictionary cache of names for all records (or those changed since)"
         if not requestor:
             requestor = Source.MAIN.r()
 
-        "Return dictionary cache of names for all records"
-        final = {}
-        q = requestor.query(cls)
-        if caveat:
-            q = q.filter(caveat)
-        for item in q.all():
-            # print(item)
-            for name in item.names:
-                final[name] = item.id
-        return final
+        return {
+            row.name: row.id
+            for row in cls.queryCacheNames(requestor, caveat=caveat, since=since)
+        }
+
+    @classmethod
+    def getCache(cls, caveat=None, requestor: Source = None) -> Cache:
+        """Name cache for the caveat, loaded from the database when missing.
+        An expired cache only fetches the names changed since its last refresh, a full
+        reload happens every _cacheRefreshFull seconds to drop deleted or renamed records"""
+        if not requestor:
+            requestor = Source.MAIN.r()
+
+        cacheName = "names" if caveat is None else str(caveat)
+
+        with cls._lock_caches:
+            cache = cls._caches.get(cacheName)
+            if cache is not None and not cache.hasExpired:
+                return cache
+
+            if (
+                cache is not None
+                and cache.watermark is not None
+                and (time.monotonic() - cache.timeCreated) < cls._cacheRefreshFull
+            ):
+                # Refresh merges idempotently, re-reading the lag is harmless
+                rows = cls.queryCacheNames(
+                    requestor,
+                    caveat=caveat,
+                    since=cache.watermark - cls._cacheWatermarkLag,
+                )
+                cache.refresh(
+                    data={row.name: row.id for row in rows},
+                    watermark=max(
+                        [row.timeUpdated for row in rows if row.timeUpdated],
+                        default=cache.watermark,
+                    ),
+                )
+                return cache
+
+            rows = cls.queryCacheNames(requestor, caveat=caveat)
+            cache = cls._caches[cacheName] = Cache(
+                data={row.name: row.id for row in rows},
+                timeout=cls._cacheTimeout,
+                size_learned=cls._cacheSizeLearned,
+                watermark=max(
+                    [row.timeUpdated for row in rows if row.timeUpdated], default=None
+                ),
+            )
+            return cache
 
     @classmethod
     def matchFuzzy(cls, key: str, caveat=None, requestor: Source = None) -> int:
@@ -392,49 +667,68 @@ class Model:
         if not requestor:
             requestor = Source.MAIN.r()
 
-        cacheName = "names" if caveat is None else str(caveat)
-
-        try:
-            if cls._caches[cacheName].hasExpired:
-                raise KeyError
-                # NOTE: Raising a KeyError is not the best thing to do,
-                # but techically the key shouldn't exist, so it is okay
-        except AttributeError:
-            # Class does not have _caches attribute, declare variable and retry
-            cls._caches = {}
-            # RECURSIVE -->
-            return cls.matchFuzzy(key, caveat=caveat, requestor=requestor)
-        except KeyError:
-            cls._caches[cacheName] = Cache(
-                data=cls.getCacheNames(caveat=caveat, requestor=requestor)
-            )
+        cache = cls.getCache(caveat=caveat, requestor=requestor)
 
         key = key.upper()
 
         try:
             # Try to just get by key name
-            return cls._caches[cacheName][key]
+            return cache[key]
         except KeyError:
             pass
 
-        # Continue to fuzzy matching
-        # print(cls._caches[cacheName], cacheName)
-        #
-        # print()
-        # print(cls.getCacheNames(, caveat=caveat))
-        r = process.extractOne(key, list(cls._caches[cacheName].keys()))
-        if r[1] < cls._matchFuzzyThreshold:
+        # Continue to fuzzy matching, only scoring the shortlist from the trigram index
+        r = cache.extractOne(key, score_cutoff=cls._matchFuzzyThreshold)
+        if r is None:
             cls.output(
-                f"[FUZZY] Bad matching: {key}, best: {r[0]}, score: {r[1]}",
+                f"[FUZZY] Bad matching: {key}, nothing scored {cls._matchFuzzyThreshold} or more",
                 option_line_clear=True,
                 option_status="CAUTION",
             )
             # raise Exception_BadFuzzyMatch()
-            return cls._caches[cacheName].learnAndReturn(key, None)
+            return cache.learnAndReturn(key, None)
         else:
-            return cls._caches[cacheName].learnAndReturn(
-                key, cls._caches[cacheName].get(r[0])
-            )
+            return cache.learnAndReturn(key, r[2])
+
+    @classmethod
+    def matchFuzzyMany(
+        cls,
+        keys: List[str],
+        caveat=None,
+        requestor: Source = None,
+        processes: int = None,
+    ) -> List[int]:
+        """matchFuzzy for many keys at once (ex: all the ingredient names of an import).
+        Keys are deduplicated, exact hits are answered in one pass over the cache and the misses
+        are scored together, across `processes` worker processes if given.
+        Returns ids in the order of keys"""
+        if not requestor:
+            requestor = Source.MAIN.r()
+
+        cache = cls.getCache(caveat=caveat, requestor=requestor)
+
+        keysUnique = list(
+            dict.fromkeys(key.upper() for key in keys if isinstance(key, str) and key)
+        )
+        found, misses = cache.getMany(keysUnique)
+
+        for key, r in zip(
+            misses,
+            cache.extractMany(
+                misses, score_cutoff=cls._matchFuzzyThreshold, processes=processes
+            ),
+        ):
+            if r is None:
+                cls.output(
+                    f"[FUZZY] Bad matching: {key}, nothing scored {cls._matchFuzzyThreshold} or more",
+                    option_status="CAUTION",
+                )
+            found[key] = cache.learnAndReturn(key, r[2] if r else None)
+
+        return [
+            found.get(key.upper()) if isinstance(key, str) and key else None
+            for key in keys
+        ]
 
     def __repr__(self):
         "Returns string representation with all primary key values"
@@ -553,9 +847,9 @@ class TimeStamped:
     def timeCreated(cls):
         return Column(DateTime, server_default=func.now())
 
-    # @declared_attr
-    # def timeUpdated(cls):
-    #     return Column(DateTime, server_default=func.now(), onupdate=func.now())
+    @declared_attr
+    def timeUpdated(cls):
+        return Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 
 Base = declarative_base(cls=Model)
@@ -1,9 +1,10 @@
 import enum
 import inspect
 import re
+import time
 import types
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Callable, Dict, List
 import sqlalchemy as sa
 
 from sqlalchemy import (
@@ -30,15 +31,79 @@ from sqlalchemy.schema import ForeignKeyConstraint, Index, UniqueConstraint
 
 from ..core.helpers import get_name_related
 from ..core.console import output
+from .datafy import DatafyPlan
 
 
 def accessible(func):
     """Property that sets the _accessible attribute on functions so that Binder can add
-    them to functions that can be used from the client side"""
+    them to functions that can be used from the client side.
+    The flagged functions are registered in the class's _accessibles when it is defined (Model.__init_subclass__)"""
     func._accessible = True
     return func
 
 
+def is_accessible(attr) -> bool:
+    "Flagged by @accessible, either directly or under a classmethod/staticmethod"
+    return bool(
+        getattr(attr, "_accessible", False)
+        or getattr(getattr(attr, "__func__", None), "_accessible", False)
+    )
+
+
+def get_accessibles(cls) -> Dict[str, object]:
+    """{name: raw attribute} of the @accessible functions of a class and its bases.
+    Only the class dictionaries are read, no getattr on columns or other descriptors"""
+    final = {}
+    for base in reversed(cls.__mro__):
+        for name, attr in vars(base).items():
+            if is_accessible(attr):
+                final[name] = attr
+            else:
+                # Overridden without @accessible, no longer accessible
+                final.pop(name, None)
+    return final
+
+
+@dataclass
+class Accessible:
+    """An @accessible function ready to be dispatched (ex: from a client side call),
+    its callable and signature are resolved once by BinderSlave.setAccessibles"""
+
+    name: str
+    function: Callable
+    signature: inspect.Signature
+    option_instance: bool = False  # Plain method, called on an instance of the model
+
+    @classmethod
+    def from_model(cls, model: type, name: str, attr) -> "Accessible":
+        option_instance = not isinstance(attr, (classmethod, staticmethod))
+        # Bound to the model for class and static methods
+        function = attr if option_instance else getattr(model, name)
+        signature = inspect.signature(function)
+        if option_instance:
+            # Without self
+            signature = signature.replace(
+                parameters=list(signature.parameters.values())[1:]
+            )
+        return cls(
+            name=name,
+            function=function,
+            signature=signature,
+            option_instance=option_instance,
+        )
+
+    def __call__(self, *args, **kwargs):
+        """Check the arguments against the signature, then call.
+        For plain methods the first argument is the instance"""
+        if self.option_instance:
+            if not args or args[0] is None:
+                raise TypeError(f"{self.name} has to be called on an instance")
+            self.signature.bind(*args[1:], **kwargs)
+        else:
+            self.signature.bind(*args, **kwargs)
+        return self.function(*args, **kwargs)
+
+
 @dataclass
 class Relator:
     """Class for defining relations.
@@ -59,6 +124,7 @@ class Relator:
     is_self: bool = False
     option_doBack: bool = True
     model: type = None
+    option_verbose: bool = False
 
     # option_snake_case: bool = True # Whether or not names are
 
@@ -125,10 +191,11 @@ class Relator:
 
         else:
             # Assume model to relate to (treat as model-to-model relation)
-            output(
-                source=self,
-                message=f"[{self.model.__name__}] {self.idAttributeName} REFERENCES {self.target}",
-            )
+            if self.option_verbose:
+                output(
+                    source=self,
+                    message=f"[{self.model.__name__}] {self.idAttributeName} REFERENCES {self.target}",
+                )
             # col = Column(self.idAttributeName, ForeignKey(
             #     self.target.id), primary_key=primary_key)
 
@@ -177,7 +244,8 @@ class Relator:
         )
 
     def relate_column(self, column) -> sa.Column:
-        output(source=self, message=f"[{self.model.__name__}] COLUMN {column}")
+        if self.option_verbose:
+            output(source=self, message=f"[{self.model.__name__}] COLUMN {column}")
         setattr(self.model, column.name, column)
         return column
 
@@ -207,6 +275,8 @@ class Relator:
 class Binder:
     modelBase: type
     children: List = field(default_factory=list)
+    timings: Dict[type, float] = field(default_factory=dict)
+    timeTotal: float = 0.0
 
     def bind(self, option_verbose: bool = False):
         """
@@ -245,16 +315,20 @@ class Binder:
         if option_verbose:
             output(source=self, message="Executing bind...")
 
+        timeStart = time.perf_counter()
         for model in [
             _model
             for _model in self.modelBase._decl_class_registry.values()
             if hasattr(_model, "__table__")
         ]:
+            timeModel = time.perf_counter()
             model.__class_init_pre__()
             model.__class_init__()
-            BinderSlave(modelBase=self.modelBase, model=model).main(
-                option_verbose=option_verbose
-            )
+            binderSlave = BinderSlave(modelBase=self.modelBase, model=model)
+            binderSlave.main(option_verbose=option_verbose)
+            # Serialization plan, so Datafy does no reflection per object
+            model._datafy = DatafyPlan.from_binder(binderSlave)
+            self.timings[model] = time.perf_counter() - timeModel
             # self.children.append(
             #
             # )
@@ -266,6 +340,22 @@ class Binder:
             # model.defined = cls.relator(model, model.defined, primary=True)
             # model.related = cls.relator(model, model.related)
 
+        self.timeTotal = time.perf_counter() - timeStart
+        if option_verbose:
+            [output(source=self, message=line) for line in self.report().split("\n")]
+
+    def report(self) -> str:
+        "Startup timing of the last bind, slowest models first"
+        return "\n".join(
+            [f"Bound {len(self.timings)} models in {self.timeTotal * 1000 :.1f}ms"]
+            + [
+                f"{model.__name__ :>30} {seconds * 1000 :8.2f}ms"
+                for model, seconds in sorted(
+                    self.timings.items(), key=lambda x: x[1], reverse=True
+                )
+            ]
+        )
+
 
 @dataclass
 class BinderSlave:
@@ -279,11 +369,13 @@ class BinderSlave:
     modelBase: type
     model: type
     accessibles: List[str] = field(default_factory=list)
+    dispatch: Dict[str, Accessible] = field(default_factory=dict)
     defined: List = field(default_factory=list)
     related: List = field(default_factory=list)
     indexes: List = field(default_factory=list)
 
     relators: List[Relator] = field(default_factory=list)
+    option_verbose: bool = False
 
     @classmethod
     def primaryKeyColumnNames(cls, model) -> list:
@@ -340,12 +432,25 @@ class BinderSlave:
                 self.addToRelated(model, base.__bases__)
 
     def setAccessibles(self):
-        "Add accessible flagged functions to a list, for API calls"
-        for name, attr in (
-            (name, getattr(self.model, name, None)) for name in dir(self.model)
-        ):
-            if callable(attr) and getattr(attr, "_accessible", False):
-                self.accessibles.append(name)
+        "Dispatch table of the accessible flagged functions, for API calls"
+        registry = getattr(self.model, "_accessibles", None)
+        if registry is None:
+            # Model not built on Model.__init_subclass__
+            registry = get_accessibles(self.model)
+        for name, attr in registry.items():
+            self.dispatch[name] = Accessible.from_model(self.model, name, attr)
+        self.accessibles = list(self.dispatch)
+
+    def call(self, name: str, instance=None, args: tuple = (), kwargs: dict = None):
+        """Call an accessible function by name, instance is only used by plain methods,
+        ex: Drink._binder.call('find', args=['mojito'])"""
+        try:
+            accessible = self.dispatch[name]
+        except KeyError:
+            raise AttributeError(f"{self.model.__name__} has no accessible {name !r}")
+        if accessible.option_instance:
+            return accessible(instance, *args, **(kwargs or {}))
+        return accessible(*args, **(kwargs or {}))
 
     def allRelators(self) -> list:
         "WARNING: Use the relators attribute instead"
@@ -368,6 +473,7 @@ class BinderSlave:
         return final
 
     def main(self, option_verbose: bool = False):
+        self.option_verbose = option_verbose
         if option_verbose:
             output(source=self, message=f"Binding {self.model} to {self.modelBase}")
 
@@ -398,11 +504,12 @@ class BinderSlave:
         for col in self.model.__table__.columns:
             if isinstance(col.type, (DateTime, Date)):
 
-                output(
-                    source=self,
-                    message=f"Setting index for {self.model.__table__} > {col} ({col.type})",
-                    # option_status=Status.IMPORTANT,
-                )
+                if option_verbose:
+                    output(
+                        source=self,
+                        message=f"Setting index for {self.model.__table__} > {col} ({col.type})",
+                        # option_status=Status.IMPORTANT,
+                    )
                 # col.index = True
                 # NOTE: sqlalchemy makes indexes like "ix_InvoiceItem_childId"
                 self.model.__table__.append_constraint(
@@ -433,7 +540,10 @@ class BinderSlave:
 
         model = self.model
 
-        output(source=self, message=f"Deciphering {x !r} for model {self.model !r}")
+        if self.option_verbose:
+            output(
+                source=self, message=f"Deciphering {x !r} for model {self.model !r}"
+            )
 
         if isinstance(x, list):
             "Has multiple classes that are unique together"
@@ -457,13 +567,17 @@ class BinderSlave:
 
         elif isinstance(x, Column):
             "EXIT"
-            output(source=self, message="[{}] COLUMN {}".format(model.__name__, x))
+            if self.option_verbose:
+                output(source=self, message="[{}] COLUMN {}".format(model.__name__, x))
             # setattr(model, x.name, x)
-            return [Relator(target=x, model=self.model)]
+            return [
+                Relator(target=x, model=self.model, option_verbose=self.option_verbose)
+            ]
 
         elif isinstance(x, Relator):
             "EXIT"
             x.model = model
+            x.option_verbose = self.option_verbose
             return [x]
 
         elif isinstance(x, str):
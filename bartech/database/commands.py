@@ -5,6 +5,9 @@ from alembic.config import Config
 from alembic import command
 from pathlib import Path
 
+from .base import Base
+from .loaders import RecipeLoader
+from .seeder import Seeder
 from .sources import Source
 
 
@@ -25,6 +28,25 @@ def upgrade():
     command.upgrade(alembic_cfg, "head")
 
 
+@click.command()
+@click.argument("path", type=click.Path(exists=True), default="data/data_drinks.yaml")
+@click.option("--size-batch", default=1000, help="Recipes per batch (one commit each)")
+@click.option("--fuzzy", is_flag=True, help="Match ingredient names to existing ones")
+def load(path, size_batch, fuzzy):
+    "Load a recipe file (YAML, JSON or JSON lines)"
+    RecipeLoader(requestor=source, size_batch=size_batch, option_fuzzy=fuzzy).load(path)
+
+
+@click.command()
+@click.option("--workers", default=4, help="Models seeded at the same time")
+@click.option("--size-chunk", default=1000, help="Rows per commit")
+def seed(workers, size_chunk):
+    "Seed every model from its _data, in foreign key order"
+    Seeder(
+        modelBase=Base, requestor=source, workers=workers, size_chunk=size_chunk
+    ).seed()
+
+
 # The following should be found at the end of the file
 commands = click.Group(name="database")
 [commands.add_command(x) for x in locals().values() if isinstance(x, click.Command)]
@@ -0,0 +1,136 @@
+import datetime
+import enum
+import inspect
+import json
+import operator
+import typing
+from dataclasses import dataclass, field
+
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+
+def default_json(obj):
+    "json.dumps default for the values Datafy emits"
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, enum.Enum):
+        return obj.name
+    return str(obj)
+
+
+@dataclass
+class DatafyPlan:
+    """What Datafy emits for a model, compiled once by Binder.bind:
+    the columns, and the many-to-one relations (from the binder relators) to nest up to depth"""
+
+    model: type
+    columns: typing.List[str]
+    relations: typing.List[typing.Tuple[str, type]] = field(default_factory=list)
+    depth: int = 1
+
+    getter: typing.Callable = field(init=False, repr=False)
+
+    def __post_init__(self):
+        getter = operator.attrgetter(*self.columns)
+        # attrgetter returns a bare value for a single attribute ->
+        self.getter = (
+            getter if len(self.columns) > 1 else (lambda instance: (getter(instance),))
+        )
+
+    @classmethod
+    def from_binder(cls, binder) -> "DatafyPlan":
+        return cls(
+            model=binder.model,
+            columns=[column.key for column in binder.model.__table__.columns],
+            relations=[
+                (relator.attributeName, relator._model_target)
+                for relator in binder.relators
+                if (
+                    inspect.isclass(relator.target)
+                    and issubclass(relator.target, binder.modelBase)
+                )
+                or isinstance(relator.target, InstrumentedAttribute)
+            ],
+            depth=getattr(binder.model, "_datafyDepth", 1),
+        )
+
+
+@dataclass
+class Datafy:
+    "Plain dict (or JSON) of a record, following its compiled DatafyPlan"
+
+    instance: object
+    depth: int = None
+
+    def main(self) -> dict:
+        plan = self.instance.__class__._datafy
+        return self.datafy(
+            self.instance, plan, plan.depth if self.depth is None else self.depth
+        )
+
+    def json(self) -> str:
+        return json.dumps(self.main(), default=default_json)
+
+    @classmethod
+    def datafy(cls, instance, plan: DatafyPlan, depth: int) -> dict:
+        final = dict(zip(plan.columns, plan.getter(instance)))
+        if depth > 0:
+            for name, target in plan.relations:
+                related = getattr(instance, name)
+                final[name] = (
+                    None
+                    if related is None
+                    else cls.datafy(related, target._datafy, depth - 1)
+                )
+        return final
+
+    @classmethod
+    def query(cls, session, model: type, *criterion, depth: int = None) -> typing.List[dict]:
+        """Bulk mode: datafy every record matching the criterion from one SELECT of plain
+        column tuples (relations outer joined), without loading any ORM instance"""
+        plan = model._datafy
+        depth = plan.depth if depth is None else depth
+
+        columns, joins, sections = [], [], []
+
+        def walk(entity, plan: DatafyPlan, path: tuple, depth: int):
+            # Sections are in walk order, so a parent always comes before its relations
+            sections.append((path, plan.columns, len(columns)))
+            columns.extend(getattr(entity, name) for name in plan.columns)
+            if depth > 0:
+                for name, target in plan.relations:
+                    alias = aliased(target)
+                    joins.append((alias, getattr(entity, name)))
+                    walk(alias, target._datafy, (*path, name), depth - 1)
+
+        walk(model, plan, (), depth)
+
+        query = session.query(*columns)
+        for alias, relation in joins:
+            query = query.outerjoin(alias, relation)
+
+        final = []
+        for row in query.filter(*criterion):
+            nodes = {}
+            for path, names, offset in sections:
+                values = row[offset : offset + len(names)]
+                if path and (
+                    nodes.get(path[:-1]) is None or values[names.index("id")] is None
+                ):
+                    # Missing relation (or its parent is), the id is never null otherwise
+                    nodes[path] = None
+                else:
+                    nodes[path] = dict(zip(names, values))
+                if path and nodes.get(path[:-1]) is not None:
+                    nodes[path[:-1]][path[-1]] = nodes[path]
+            final.append(nodes[()])
+        return final
+
+    @classmethod
+    def query_json(cls, session, model: type, *criterion, depth: int = None) -> str:
+        return json.dumps(
+            cls.query(session, model, *criterion, depth=depth), default=default_json
+        )
@@ -0,0 +1,183 @@
+"Bulk loading of recipe files (ex: data/data_drinks.yaml) into Drink, Ingredient and DrinkIngredient"
+import itertools
+import json
+import re
+import time
+import typing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import sqlalchemy as sa
+import yaml
+
+from ..core.console import output
+from .models import Drink, DrinkIngredient, Ingredient
+from .sources import Source
+
+try:
+    # libyaml bindings, several times faster than the pure python loader
+    from yaml import CSafeLoader as LoaderYAML
+except ImportError:
+    from yaml import SafeLoader as LoaderYAML
+
+try:
+    import orjson
+
+    loads_json = orjson.loads
+except ImportError:
+    loads_json = json.loads
+
+
+def normalize_name(name) -> str:
+    "Strip and collapse whitespace, ex: 'soda ' (from 'soda :') -> 'soda'"
+    return re.sub(r"\s+", " ", str(name)).strip()
+
+
+def get_id(instance) -> typing.Optional[int]:
+    """Primary key without a refresh, instances come back expired from get_or_create_many.
+    None for the rows get_or_create_many could not create"""
+    return sa.inspect(instance).identity[0] if instance is not None else None
+
+
+def iter_recipes(path: Path) -> typing.Iterator[typing.Tuple[str, dict]]:
+    """Stream (drink name, recipe) pairs from a YAML, JSON or JSON lines file.
+    YAML is parsed one top-level entry at a time, so memory does not grow with the file."""
+    path = Path(path)
+    with open(path, "r") as fh:
+        if path.suffix == ".jsonl":
+            for line in fh:
+                if line.strip():
+                    yield from loads_json(line).items()
+
+        elif path.suffix == ".json":
+            yield from loads_json(fh.read()).items()
+
+        else:
+            lines = []
+            for line in itertools.chain(fh, [""]):
+                if lines and (line == "" or not line[0].isspace()) and line[:1] != "#":
+                    # A new top-level key (or the end), the buffered entry is complete
+                    yield from (yaml.load("".join(lines), Loader=LoaderYAML) or {}).items()
+                    lines = []
+                # Blank lines are kept, they are part of block scalars (|, >)
+                if line and line.rstrip() != "---":
+                    lines.append(line)
+
+
+@dataclass
+class LoaderStats:
+    recipes: int = 0
+    drinks: int = 0
+    ingredients: int = 0
+    drinkIngredients: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows(self) -> int:
+        return self.drinks + self.ingredients + self.drinkIngredients
+
+    @property
+    def rowsPerSecond(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class RecipeLoader:
+    """Loads recipes in batches of size_batch: one bulk get-or-create per model per batch,
+    so the number of round trips does not depend on the number of ingredients.
+    With option_fuzzy, ingredient names are first matched to existing ones (Ingredient.matchFuzzyMany)"""
+
+    requestor: Source
+    size_batch: int = 1000
+    option_fuzzy: bool = False
+
+    stats: LoaderStats = field(default_factory=LoaderStats)
+
+    def load(self, path: Path) -> LoaderStats:
+        timeStart = time.perf_counter()
+        recipes = iter_recipes(path)
+        while True:
+            batch = list(itertools.islice(recipes, self.size_batch))
+            if not batch:
+                break
+            self.load_batch(batch)
+            self.stats.seconds = time.perf_counter() - timeStart
+            output(
+                source=self,
+                message=f"{self.stats.recipes} recipes, {self.stats.rows} rows "
+                f"({self.stats.rowsPerSecond:,.0f} rows/s)",
+                option_line_clear=True,
+            )
+
+        output(
+            source=self,
+            message=f"Loaded {path}: {self.stats}, {self.stats.rowsPerSecond:,.0f} rows/s",
+            option_status="GOOD",
+        )
+        return self.stats
+
+    def load_batch(self, batch: typing.List[typing.Tuple[str, dict]]):
+        # Names are normalized and deduplicated case insensitively, first spelling wins ->
+        recipes = {}
+        for name, recipe in batch:
+            recipes.setdefault(normalize_name(name).casefold(), (normalize_name(name), recipe or {}))
+
+        namesIngredient = {}
+        for _, recipe in recipes.values():
+            for name in (recipe.get("ingredients") or {}):
+                namesIngredient.setdefault(normalize_name(name).casefold(), normalize_name(name))
+
+        drinks = Drink.get_or_create_many(
+            self.requestor,
+            [
+                {"name": name, "category": recipe.get("category")}
+                for name, recipe in recipes.values()
+            ],
+        )
+        idsDrink = dict(zip(recipes, map(get_id, drinks)))
+        for key, id in idsDrink.items():
+            if id is None:
+                raise Exception(f"Could not create the Drink of recipe {recipes[key][0] !r}")
+
+        idsIngredient = self.resolve_ingredients(namesIngredient)
+
+        rows = {}
+        for key, (_, recipe) in recipes.items():
+            for name, parts in (recipe.get("ingredients") or {}).items():
+                idIngredient = idsIngredient[normalize_name(name).casefold()]
+                if idIngredient is None:
+                    raise Exception(
+                        f"Could not create Ingredient {normalize_name(name) !r} of recipe {recipes[key][0] !r}"
+                    )
+                rows[(idsDrink[key], idIngredient)] = {
+                    "drinkId": idsDrink[key],
+                    "ingredientId": idIngredient,
+                    "parts": parts,
+                }
+        DrinkIngredient.get_or_create_many(self.requestor, list(rows.values()))
+
+        self.stats.recipes += len(batch)
+        self.stats.drinks += len(drinks)
+        self.stats.ingredients += len(namesIngredient)
+        self.stats.drinkIngredients += len(rows)
+
+    def resolve_ingredients(self, names: typing.Dict[str, str]) -> typing.Dict[str, int]:
+        "{casefolded name: Ingredient id}, creating the missing ingredients"
+        final = {}
+        if self.option_fuzzy:
+            keys = list(names)
+            for key, id in zip(
+                keys,
+                Ingredient.matchFuzzyMany(
+                    [names[key] for key in keys], requestor=self.requestor
+                ),
+            ):
+                if id is not None:
+                    final[key] = id
+
+        missing = [key for key in names if key not in final]
+        ingredients = Ingredient.get_or_create_many(
+            self.requestor, [{"name": names[key]} for key in missing]
+        )
+        final.update(zip(missing, map(get_id, ingredients)))
+        return final
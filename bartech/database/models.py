@@ -2,23 +2,24 @@ from sqlalchemy import Column, Integer, String, Boolean, Float
 from sqlalchemy_utils import EmailType, PhoneNumberType
 
 from . import column_generators as col_gen
-from .base import Base
+from .base import Base, TimeStamped
 from .binder import Relator
 
 import numpy as np
 
 
-class Drink(Base):
+class Drink(Base, TimeStamped):
     name = Column(String, unique=True)
+    category = Column(String)
 
 
-class DrinkNameAlt(Base):
+class DrinkNameAlt(Base, TimeStamped):
     _defined = [Drink]
 
     name = Column(String, unique=True)
 
 
-class Ingredient(Base):
+class Ingredient(Base, TimeStamped):
     name = Column(String, unique=True)
 
     _related = [Relator(is_self=True, name_append="parent")]
@@ -26,3 +27,5 @@ class Ingredient(Base):
 
 class DrinkIngredient(Base):
     _defined = [Drink, Ingredient]
+
+    parts = Column(Float)
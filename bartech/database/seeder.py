@@ -0,0 +1,109 @@
+"Seeding of every model's _data, in foreign key order, with independent models in parallel"
+import inspect
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+from ..core.console import output
+from .sources import Source
+
+
+@dataclass
+class Seeder:
+    """Runs Model.createAll for every bound model once the models it references are seeded.
+    Dependencies come from the binder relators, each model is seeded on its own pooled session
+    (Source.session_scope) and commits every size_chunk rows, so a full reseed takes about as
+    long as the slowest chain of dependent models rather than the sum of all of them"""
+
+    modelBase: type
+    requestor: Source
+    workers: int = 4
+    size_chunk: int = 1000
+
+    timings: typing.Dict[type, float] = field(default_factory=dict)
+
+    @property
+    def models(self) -> typing.List[type]:
+        return [
+            model
+            for model in self.modelBase._decl_class_registry.values()
+            if hasattr(model, "__table__")
+        ]
+
+    def get_dependencies(self) -> typing.Dict[type, typing.Set[type]]:
+        "Models each model references (self references left out)"
+        final = {}
+        for model in self.models:
+            final[model] = set()
+            for relator in model._binder.relators:
+                if not (
+                    (
+                        inspect.isclass(relator.target)
+                        and issubclass(relator.target, self.modelBase)
+                    )
+                    or isinstance(relator.target, InstrumentedAttribute)
+                ):
+                    # Plain column or enum, no foreign key
+                    continue
+                if relator._model_target is not model:
+                    final[model].add(relator._model_target)
+        return final
+
+    def get_levels(self) -> typing.List[typing.List[type]]:
+        "Topological order as levels, every model only references models in earlier levels"
+        dependencies = self.get_dependencies()
+        done, levels = set(), []
+        while len(done) < len(dependencies):
+            level = [m for m, d in dependencies.items() if m not in done and d <= done]
+            if not level:
+                raise Exception(
+                    f"Circular references between {[m for m in dependencies if m not in done]}"
+                )
+            levels.append(sorted(level, key=lambda m: m.__name__))
+            done.update(level)
+        return levels
+
+    def seed_model(self, model: type) -> float:
+        timeStart = time.perf_counter()
+        if model._data:
+            with self.requestor.session_scope() as session:
+                model.createAll(session, size_chunk=self.size_chunk)
+        return time.perf_counter() - timeStart
+
+    def seed(self) -> typing.Dict[type, float]:
+        "Seed everything, returns {model: seconds}"
+        dependencies = self.get_dependencies()
+        self.get_levels()  # Fail early on cycles
+        timeStart = time.perf_counter()
+
+        done, running = set(), {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while len(done) < len(dependencies):
+                for model, references in dependencies.items():
+                    if (
+                        model not in done
+                        and model not in running.values()
+                        and references <= done
+                    ):
+                        running[executor.submit(self.seed_model, model)] = model
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    model = running.pop(future)
+                    self.timings[model] = future.result()
+                    done.add(model)
+                    output(
+                        source=self,
+                        message=f"{model.__name__ :<30} {self.timings[model] :8.3f}s",
+                    )
+
+        output(
+            source=self,
+            message=f"Seeded {len(done)} models in {time.perf_counter() - timeStart :.3f}s "
+            f"(sum of models {sum(self.timings.values()) :.3f}s)",
+            option_status="GOOD",
+        )
+        return self.timings
@@ -1,13 +1,37 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
 import inspect
+import pickle
 import re
+import time
 import typing
-from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
 from pprint import pprint
+from threading import Lock
 
 import sqlalchemy as sa
 import yaml
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import Query, Session, sessionmaker
+from sqlalchemy.orm import Query, Session, scoped_session, sessionmaker
+
+from ..core.console import output
+from ..core.constants import PATH_CACHE
+from ..core.metrics import METRICS, REQUEST_STATS
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:
+    # SQLAlchemy < 1.4, Source.run falls back to a thread pool
+    AsyncSession = create_async_engine = None
+
+PATH_CACHE_METADATA = PATH_CACHE / "metadata"
+
+# Sync drivers and the asyncio driver that replaces them for Source.engine_async
+DRIVERS_ASYNC = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
 
 with open("config.yaml", "r") as fh:
     YAML_CONNECTIONS = yaml.load(fh, Loader=yaml.FullLoader)
@@ -16,6 +40,92 @@ with open("secrets.yaml", "r") as fh:
     YAML_CONNECTIONS_SECRETS = yaml.load(fh, Loader=yaml.FullLoader)
 
 
+@dataclass
+class PoolStats:
+    "Connection pool counters of a Source, see Source.pool_status"
+    connects: int = 0
+    checkouts: int = 0
+    checkins: int = 0
+    checkedOut: int = 0
+    waits: int = 0
+    waitTotal: float = 0.0
+    waitMax: float = 0.0
+    leaks: int = 0  # Connections returned after being held more than leak_timeout
+
+    # {connection record: checkout time} of the connections out right now
+    timesCheckout: dict = field(default_factory=dict, repr=False)
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def getHeld(self, timeout: float) -> typing.List[float]:
+        "Seconds held of the connections checked out for more than timeout (leak suspects)"
+        now = time.monotonic()
+        with self._lock:
+            held = [now - t for t in self.timesCheckout.values()]
+        return sorted((s for s in held if s > timeout), reverse=True)
+
+    def addWait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.waitTotal += seconds
+            self.waitMax = max(self.waitMax, seconds)
+
+
+class PoolTimed:
+    """Mixin for a pool class, times how long each checkout waits for a connection
+    (opening a new one included). The wait is left in the record's info for the
+    checkout event of Source.listen_pool, so every checkout is counted:
+    Source.connect, sessions and scoped sessions alike"""
+
+    def _do_get(self):
+        timeStart = time.monotonic()
+        connection_record = super()._do_get()
+        connection_record.info["bartech_wait"] = time.monotonic() - timeStart
+        return connection_record
+
+
+@functools.lru_cache(maxsize=None)
+def get_pool_timed(poolclass: type) -> type:
+    "poolclass with PoolTimed mixed in, Pool.recreate (dispose) keeps the class"
+    return type(f"{poolclass.__name__}Timed", (PoolTimed, poolclass), {})
+
+
+@dataclass
+class SourceClasses:
+    """Lazy stand-in for automap's Base.classes (Source.c).
+    A schema is only reflected the first time one of its classes is asked for"""
+
+    source: "Source"
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        for schema in self.source.schemas_for(name):
+            try:
+                return getattr(self.source.reflect_schema(schema).classes, name)
+            except AttributeError:
+                continue
+        raise AttributeError(f"No table {name !r} in {self.source !r}")
+
+    def __getitem__(self, name: str):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __iter__(self):
+        "WARNING: Reflects every schema"
+        for schema in self.source.reflect:
+            yield from self.source.reflect_schema(schema).classes
+
+    def __dir__(self) -> list:
+        return [
+            name
+            for base in self.source.bases.values()
+            for name in base.classes.keys()
+        ]
+
+
 @dataclass()
 class Source:
     "Data source, considered one database"
@@ -38,7 +148,13 @@ class Source:
 
     engine: sa.engine.Engine = None
     metadata: sa.MetaData = None
+    bases: typing.Dict[str, type] = field(default_factory=dict)  # Automap base per schema
+    _lock_reflect: Lock = field(default_factory=Lock, repr=False)
     session: Session = None
+    session_scoped: scoped_session = None
+    _engine_async: object = field(default=None, repr=False)
+    _executor: ThreadPoolExecutor = field(default=None, repr=False)
+    stats: PoolStats = field(default_factory=PoolStats)
 
     @classmethod
     def from_name(cls, name: str):
@@ -58,6 +174,24 @@ class Source:
             for name in YAML_CONNECTIONS["connections"]["sources"].keys()
         ]
 
+    @classmethod
+    def reset_after_fork(cls):
+        """Call at the start of a forked child. Pooled connections inherited from the parent are
+        dropped without being closed (closing them would end the parent's sessions),
+        so the child opens its own"""
+        for source in cls.sources.values():
+            try:
+                source.engine.dispose(close=False)
+            except TypeError:
+                # SQLAlchemy < 1.4.33 has no close argument
+                source.engine.pool = source.engine.pool.recreate()
+            source._engine_async = None
+            source._executor = None
+            # The parent's checked out connections are not this process's
+            source.stats = PoolStats()
+            source.session_scoped.remove()
+            source.session = source.Session()
+
     def __post_init__(self):
         # Add to sources
         self.__class__.sources[
@@ -69,25 +203,144 @@ class Source:
         ] = self
 
         # Test the connection ->
-        self.engine = sa.create_engine(self.connection_url)
+        url = sa.engine.url.make_url(self.connection_url)
+        self.engine = sa.create_engine(
+            url,
+            poolclass=get_pool_timed(url.get_dialect().get_pool_class(url)),
+            **self.pool_options,
+        )
+        self.listen_pool()
+        self.listen_queries(self.engine)
         self.metadata = sa.MetaData()
-
-        for k, v in self.reflect.items():
-            self.metadata.reflect(bind=self.engine, schema=k, only=v)
-
-        self.Base = automap_base(metadata=self.metadata)
-        self.Base.prepare(engine=self.engine)
+        # NOTE: Schemas are reflected on first use of Source.c, see reflect_schema
 
         self.Session = sessionmaker(bind=self.engine)
+        self.session_scoped = scoped_session(self.Session)
 
         # create a Session
         self.session = self.Session()
 
-        # pprint(list(self.Base.classes))
-
     def __repr__(self):
         return f"<{self.__class__.__name__}({self.connection_dict['server']}/{self.connection_dict['database']})>"
 
+    @property
+    def pool_config(self) -> dict:
+        "Pool section of config.yaml, source specific values override the defaults"
+        return {
+            **YAML_CONNECTIONS["connections"].get("pool", {}),
+            **self.dict_yaml.get("pool", {}),
+        }
+
+    @property
+    def pool_options(self) -> dict:
+        "Keyword arguments for create_engine"
+        options = {
+            k: v
+            for k, v in self.pool_config.items()
+            if k
+            in ["pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"]
+        }
+        if self.connection_url.startswith("sqlite"):
+            # SQLite does not use a QueuePool, it rejects the sizing arguments
+            options = {
+                k: v for k, v in options.items() if k in ["pool_recycle", "pool_pre_ping"]
+            }
+        return options
+
+    def listen_pool(self):
+        "Count pool activity into self.stats"
+        timeout_leak = self.pool_config.get("leak_timeout", None)
+
+        @sa.event.listens_for(self.engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with self.stats._lock:
+                self.stats.connects += 1
+
+        @sa.event.listens_for(self.engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            wait = connection_record.info.pop("bartech_wait", None)
+            if wait is not None:
+                self.stats.addWait(wait)
+            with self.stats._lock:
+                self.stats.timesCheckout[connection_record] = time.monotonic()
+                self.stats.checkouts += 1
+                self.stats.checkedOut += 1
+
+        @sa.event.listens_for(self.engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self.stats._lock:
+                timeCheckout = self.stats.timesCheckout.pop(connection_record, None)
+                self.stats.checkins += 1
+                self.stats.checkedOut -= 1
+                if (
+                    timeCheckout is not None
+                    and timeout_leak is not None
+                    and (time.monotonic() - timeCheckout) > timeout_leak
+                ):
+                    self.stats.leaks += 1
+
+    def listen_queries(self, engine: sa.engine.Engine):
+        "Time every query into METRICS, and into the stats of the request running it if any"
+        name = self.name or self.connection_dict["database"]
+
+        @sa.event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            # On the statement's own context, a failed statement leaves nothing behind
+            context._bartech_timeStart = time.perf_counter()
+
+        @sa.event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - context._bartech_timeStart
+            METRICS.observe_query(name, seconds)
+            stats = REQUEST_STATS.get()
+            if stats is not None:
+                stats.add(statement, seconds)
+
+    @property
+    def pool_status(self) -> dict:
+        """Counters for monitoring, plus the pool's own status line.
+        leaked counts the connections checked out right now for longer than leak_timeout"""
+        timeout_leak = self.pool_config.get("leak_timeout", None)
+        held = self.stats.getHeld(timeout_leak) if timeout_leak is not None else []
+        return {
+            # Not asdict, it would deep copy the lock and the connection records
+            **{
+                f.name: getattr(self.stats, f.name)
+                for f in fields(self.stats)
+                if not f.name.startswith("_") and f.name != "timesCheckout"
+            },
+            "leaked": len(held),
+            "leakedOldest": held[0] if held else None,
+            "pool": self.engine.pool.status(),
+        }
+
+    def connect(self, **kwargs) -> sa.engine.Connection:
+        "Check a connection out of the pool, the wait is counted by listen_pool"
+        return self.engine.connect(**kwargs)
+
+    @contextmanager
+    def connection_scope(self) -> typing.Iterator[sa.engine.Connection]:
+        "Pooled connection that is returned to the pool on exit"
+        connection = self.connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def session_scope(self) -> typing.Iterator[Session]:
+        """Thread-local session for one unit of work (ex: a request),
+        committed on success, rolled back on error and removed on exit"""
+        session = self.session_scoped()
+        try:
+            yield session
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        finally:
+            self.session_scoped.remove()
+
     @property
     def template(self) -> str:
         return self.__class__.templates[self.dict_yaml["template"]]
@@ -120,17 +373,152 @@ class Source:
         return self.session.query
 
     @property
-    def c(self):
-        "Quick accessor to classes"
-        return self.Base.classes
+    def c(self) -> SourceClasses:
+        "Quick accessor to classes, reflected lazily per schema"
+        return SourceClasses(source=self)
+
+    def schemas_for(self, name: str) -> typing.List[str]:
+        "Schemas that may hold table name, the ones listing it in reflect first"
+        return sorted(self.reflect, key=lambda schema: name not in (self.reflect[schema] or []))
+
+    def reflect_schema(self, schema: str) -> type:
+        "Automap base of the schema, reflected (or loaded from the metadata cache) once"
+        with self._lock_reflect:
+            try:
+                return self.bases[schema]
+            except KeyError:
+                pass
+
+            metadata = self.load_metadata(schema)
+            base = automap_base(metadata=metadata)
+            base.prepare()
+            self.bases[schema] = base
+            return base
+
+    def load_metadata(self, schema: str) -> sa.MetaData:
+        """Reflect the schema, going through the on-disk cache when `cache_metadata` is set.
+        Cache files are keyed by connection url and a fingerprint of the schema's columns"""
+        path = None
+        if self.dict_yaml.get("cache_metadata", False):
+            fingerprint = self.fingerprint_schema(schema)
+            if fingerprint:
+                key = hashlib.sha1(
+                    f"{self.connection_url}|{schema}|{self.reflect[schema]}".encode()
+                ).hexdigest()
+                path = PATH_CACHE_METADATA / f"{key}-{fingerprint}.pickle"
+
+        if path is not None and path.exists():
+            try:
+                with open(path, "rb") as fh:
+                    return pickle.load(fh)
+            except Exception as e:
+                output(
+                    source=self,
+                    message=f"Unreadable metadata cache {path} ({e !r}), reflecting",
+                    option_status="CAUTION",
+                )
+
+        metadata = sa.MetaData()
+        metadata.reflect(bind=self.engine, schema=schema, only=self.reflect[schema])
+
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as fh:
+                pickle.dump(metadata, fh)
+
+        return metadata
+
+    def fingerprint_schema(self, schema: str) -> typing.Optional[str]:
+        "Hash of the schema's table/column definitions in one query, None if not supported"
+        dialect = self.engine.dialect.name
+        if dialect in ["postgresql", "mssql"]:
+            statement = sa.text(
+                "SELECT table_name, column_name, data_type, is_nullable "
+                "FROM information_schema.columns WHERE table_schema = :schema "
+                "ORDER BY table_name, ordinal_position"
+            ).bindparams(schema=schema)
+        elif dialect == "sqlite":
+            statement = sa.text("SELECT name, sql FROM sqlite_master ORDER BY name")
+        else:
+            return None
+
+        with self.connection_scope() as connection:
+            rows = connection.execute(statement).fetchall()
+        return hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()[:16]
 
     @property
-    def execute(self):
-        return self.engine.connect().execute
+    def engine_async(self):
+        "asyncio engine on the same url, None when SQLAlchemy or the dialect has no asyncio driver"
+        if self._engine_async is None and create_async_engine is not None:
+            url = sa.engine.url.make_url(self.connection_url)
+            driver = DRIVERS_ASYNC.get(url.drivername)
+            if driver:
+                try:
+                    self._engine_async = create_async_engine(
+                        url.set(drivername=driver), **self.pool_options
+                    )
+                    self.listen_queries(self._engine_async.sync_engine)
+                except ImportError:
+                    # Driver (ex: asyncpg) not installed
+                    pass
+        return self._engine_async
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        "Threads for Source.run when there is no asyncio engine, one per pooled connection"
+        if self._executor is None:
+            config = self.pool_config
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.get("pool_size", 5) + config.get("max_overflow", 10),
+                thread_name_prefix=f"{self.__class__.__name__}-{self.name}",
+            )
+        return self._executor
+
+    async def run(self, fn: typing.Callable, *args, **kwargs):
+        """Run fn(session, *args, **kwargs) without blocking the event loop, committing on success.
+        fn gets a plain Session either way: through AsyncSession.run_sync when there is an asyncio
+        engine, otherwise on the executor's threads. Objects stay loaded after the commit"""
+        if self.engine_async is not None:
+            async with AsyncSession(self.engine_async, expire_on_commit=False) as session:
+                # Not in session.begin(), fn may commit on its own (ex: Model.get_or_create),
+                # same as run_sync: commit whatever is left, roll back on error
+                try:
+                    final = await session.run_sync(fn, *args, **kwargs)
+                    await session.commit()
+                    return final
+                except:
+                    await session.rollback()
+                    raise
+
+        # The context goes along so the queries count for the current request (REQUEST_STATS)
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor,
+            functools.partial(
+                contextvars.copy_context().run, self.run_sync, fn, *args, **kwargs
+            ),
+        )
+
+    def run_sync(self, fn: typing.Callable, *args, **kwargs):
+        "Blocking counterpart of run, on a session of its own"
+        session = self.Session(expire_on_commit=False)
+        try:
+            final = fn(session, *args, **kwargs)
+            session.commit()
+            return final
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def execute(self, *args, **kwargs) -> sa.engine.ResultProxy:
+        "Execute on a pooled connection, it goes back to the pool once the result is consumed"
+        return self.connect(close_with_result=True).execute(*args, **kwargs)
 
     @property
     def connection(self) -> sa.engine.Connection:
-        return self.engine.connect()
+        "WARNING: Caller has to close this connection, prefer connection_scope"
+        return self.connect()
 
 
 if __name__ == "__main__":
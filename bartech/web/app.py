@@ -1,12 +1,29 @@
+import asyncio
 import tornado
 import inspect
+import os
+import signal
+import sys
 import typing
 import socket
 
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.template
+import tornado.web
+import yaml
+
+from ..core import console
 from ..core.console import output
 
 from . import handlers as hd
 from . import ui
+from .constants import PATH_CONFIG, PATH_TEMPLATES, SETTINGS_MODES
+from .templates import TEMPLATES_PAGE, TEMPLATES_UI
+from .hub import WebsocketHub
+from .transforms import BrotliContentEncoding
 
 
 class AppWeb(tornado.web.Application):
@@ -17,7 +34,12 @@ class AppWeb(tornado.web.Application):
 
         "Add all the pages by their names here."
         for handler_name, handler_cls in inspect.getmembers(hd, inspect.isclass):
-            if (
+            if issubclass(handler_cls, hd.HandlerAPIModel):
+                if handler_cls.model_name:
+                    handlers.append((handler_cls.localUrl(), handler_cls))
+            elif handler_cls in [hd.HandlerMetrics, hd.HandlerWebsocket]:
+                handlers.append((handler_cls.localUrl(), handler_cls))
+            elif (
                 issubclass(handler_cls, hd.HandlerPage)
                 and handler_cls is not hd.HandlerPage
             ):
@@ -49,28 +71,67 @@ class AppWeb(tornado.web.Application):
 
         return uis
 
-    def __init__(self):
+    @staticmethod
+    def get_config(section: str) -> dict:
+        "A top level section of config.yaml"
+        with open(PATH_CONFIG, "r") as fh:
+            return yaml.load(fh, Loader=yaml.FullLoader).get(section) or {}
+
+    @classmethod
+    def get_mode(cls) -> str:
+        "Serving mode from the BARTECH_MODE environment variable, else web.mode in config.yaml"
+        mode = os.environ.get("BARTECH_MODE")
+        if not mode:
+            mode = cls.get_config("web").get("mode", "debug")
+        if mode not in SETTINGS_MODES:
+            raise Exception(f"Unknown mode {mode !r}, use one of {list(SETTINGS_MODES)}")
+        return mode
+
+    def __init__(self, mode: str = None):
         "Set tornado settings"
+        self.mode = mode or self.get_mode()
+        # Log level and JSON lines sink, before anything is output
+        console.configure(**self.get_config("console"))
+        self.hub = WebsocketHub()
+        output(source=self, message=f"Mode is {self.mode}")
         self.get_list_ui()
 
         # NOTE: Following not fully implemented yet
         ssl_options = {"certfile": "cert.cer", "keyfile": "key.key"}
 
+        # Every template compiled once, up front. In debug, autoreload restarts the process
+        # when a template changes, rather than recompiling on every request
+        loader_template = tornado.template.Loader(str(PATH_TEMPLATES))
+        for registry in [TEMPLATES_PAGE, TEMPLATES_UI]:
+            registry.compile(loader_template)
+
+        # NOTE: ETags (and 304s on If-None-Match) are tornado's default for every handler,
+        # static files get far-future caching when requested through static_url (?v=hash)
         tornado.web.Application.__init__(
             self,
             self.get_list_handlers(),
+            transforms=(
+                [BrotliContentEncoding, tornado.web.GZipContentEncoding]
+                if SETTINGS_MODES[self.mode].get("compress_response", False)
+                else None
+            ),
             **{
                 # Tornado settings
                 "template_path": "src/templates",
+                "template_loader": loader_template,
+                "compiled_template_cache": True,
                 "static_path": "static",
-                "uis": ui,
-                "debug": True,
+                "ui_modules": ui,
                 "login_url": "/login",
                 "default_handler_class": hd.PH_NotFound,
+                **SETTINGS_MODES[self.mode],
             },
             cookie_secret="Super secret cookie 4",
         )
 
+        if self.settings.get("autoreload", False):
+            [registry.watch() for registry in [TEMPLATES_PAGE, TEMPLATES_UI]]
+
     def user_login(self, email, password):
         try:
             user = (
@@ -94,15 +155,23 @@ class AppWeb(tornado.web.Application):
                 ModelHandler.Session.add(ua)
                 return ua.key
 
-    def add_websocket(self, websocket):
-        assert isinstance(websocket, hd.Websocket)
-        self.websockets.add(websocket)
+    def get_source(self, name: str = "MAIN"):
+        "Database source for handlers, created on first use (so after any fork in serve)"
+        from ..database import Source
 
-    def serve(self, port: int = 8000):
-        "Start the server"
-        if tornado.ioloop.IOLoop.current():
-            tornado.ioloop.IOLoop.current()
+        try:
+            return Source.sources[name]
+        except KeyError:
+            return Source.from_name(name)
+
+    def add_websocket(self, websocket, user=None):
+        assert isinstance(websocket, hd.HandlerWebsocket)
+        self.hub.add(websocket, user=user)
 
+    def serve(self, port: int = 8000, workers: int = 1, timeout_shutdown: float = 5):
+        """Start the server
+        workers > 1 pre-binds the socket and forks that many processes (0 or None for one per core).
+        SIGTERM stops accepting connections and gives open ones timeout_shutdown seconds to finish."""
         ip = (
             (
                 [
@@ -122,20 +191,50 @@ class AppWeb(tornado.web.Application):
 
         output(source=self, message=f"Starting at http://{ip}:{port}/")
 
-        # Start the server
-        server = tornado.httpserver.HTTPServer(self)
-        # server.bind(int(port))
+        # Bind before forking so every worker accepts on the same socket
         # , ssl_options={
         #     "certfile": "cert.cer",
         #     "keyfile":  "key.key",
         # })
-        server.listen(int(port))
+        sockets = tornado.netutil.bind_sockets(int(port))
         # self.startWebpack()
 
-        # self.process_main = multiprocessing.Process(
-        #     target=tornado.ioloop.IOLoop.current().start, args=()
-        # )
-        # self.process_main.start()
+        if workers != 1:
+            if self.settings.get("autoreload", False):
+                raise Exception(
+                    "Autoreload (debug) does not work with multiple workers, use one worker"
+                )
+
+            # Parent: pass SIGTERM on to the workers, fork_processes exits once they all have.
+            # Each worker (restarts included) reports its pid on a pipe, so only they get it
+            self.fd_workers, fd_write = os.pipe()
+            os.set_blocking(self.fd_workers, False)
+            self.pids_workers = set()
+            signal.signal(signal.SIGTERM, self.on_sigterm_parent)
+            tornado.process.fork_processes(workers)
+
+            # Child from here on ->
+            os.write(fd_write, f"{os.getpid()}\n".encode())
+            os.close(fd_write)
+            os.close(self.fd_workers)
+            output(
+                source=self,
+                message=f"Worker {tornado.process.task_id()} started (pid {os.getpid()})",
+            )
+            if "bartech.database.sources" in sys.modules:
+                # Sources made before the fork must not share pooled connections
+                sys.modules["bartech.database.sources"].Source.reset_after_fork()
+
+        server = tornado.httpserver.HTTPServer(self)
+        server.add_sockets(sockets)
+
+        signal.signal(
+            signal.SIGTERM,
+            lambda signum, frame: tornado.ioloop.IOLoop.current().add_callback_from_signal(
+                self.shutdown, server, timeout_shutdown
+            ),
+        )
+
         try:
             tornado.ioloop.IOLoop.current().start()
         except KeyboardInterrupt:
@@ -145,17 +244,40 @@ class AppWeb(tornado.web.Application):
             quit()
             return
 
-    # @gen.coroutine
-    def chirp(self, user):
-        """Look at all websockets and have them relay chirp if the client needs to be updated"""
-        # If the user is in a campaign, update all users in that campaign, otherwise, chirp
+    def get_pids_workers(self) -> set:
+        "Pids the workers reported so far (see serve)"
+        while True:
+            try:
+                data = os.read(self.fd_workers, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.pids_workers.update(int(pid) for pid in data.split())
+        return self.pids_workers
 
-        if not self.settings.get("debug", False):
-            for x in self.websockets:
-                if x.user == user:
-                    return x.chirp()
+    def on_sigterm_parent(self, signum, frame):
+        "SIGTERM in the forking parent, relay it to the workers only"
+        output(source=self, message="Stopping workers", option_status="IMPORTANT")
+        for pid in self.get_pids_workers():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                # Worker already gone (restarted workers report their new pid)
+                pass
 
-        else:
-            # DEBUG ONLY: chirp everywhere
-            for x in self.websockets:
-                x.chirp()
+    async def shutdown(self, server, timeout: float):
+        "Stop accepting, let open connections finish for up to timeout seconds, then stop the loop"
+        output(source=self, message="Shutting down", option_status="IMPORTANT")
+        server.stop()
+        loop = asyncio.get_event_loop()
+        timeEnd = loop.time() + timeout
+        while server._connections and loop.time() < timeEnd:
+            await asyncio.sleep(0.1)
+        await server.close_all_connections()
+        tornado.ioloop.IOLoop.current().stop()
+
+    def chirp(self, user=None, topics=()):
+        """Have the websockets of the user, and of anyone following the topics
+        (see hub.get_topic), relay chirp so the client updates"""
+        self.hub.chirp(user=user, topics=topics)
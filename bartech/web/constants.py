@@ -3,3 +3,17 @@ from pathlib import Path
 
 PATH_TEMPLATES = Path() / "src" / "templates"
 PATH_STATIC = Path() / "static"
+PATH_CONFIG = Path() / "config.yaml"
+
+# Tornado settings per serving mode, chosen by BARTECH_MODE or web.mode in config.yaml
+SETTINGS_MODES = {
+    "debug": {"debug": True},
+    "production": {
+        "debug": False,
+        "autoreload": False,
+        "serve_traceback": False,
+        "compiled_template_cache": True,
+        "static_hash_cache": True,
+        "compress_response": True,
+    },
+}
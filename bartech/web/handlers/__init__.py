@@ -5,15 +5,11 @@ from pathlib import Path
 
 from .base import HandlerPage, HandlerAPI, HandlerWebsocket
 from ...core.console import output
-from ..constants import PATH_TEMPLATES
+from ..templates import TEMPLATES_PAGE
 
 # CREATE HandlerPages based on what is in the templates folder
 
-for path_template in [
-    x
-    for x in PATH_TEMPLATES.iterdir()
-    if (not x.is_dir() and re.search(r"\.html(?:\.j2)?", x.name, re.IGNORECASE))
-]:
+for tlist, path_template in TEMPLATES_PAGE:
     l = path_template.stem
     # if (
     #     not re.search(
@@ -22,7 +18,6 @@ for path_template in [
     #     or _debug
     # ):
 
-    tlist = path_template.name.split(".")[0]
     t = "".join([a if a.isupper() else b for a, b in zip(tlist, tlist.title())])
 
     _class_handler = type(f"PH_{t}", (HandlerPage,), {})
@@ -32,3 +27,5 @@ for path_template in [
 
 # Allow overwrite of handlers
 from .handlers import *
+from .api import *
+from .metrics import *
@@ -0,0 +1,112 @@
+import json
+import typing
+
+import sqlalchemy as sa
+import tornado.web
+from sqlalchemy.orm import aliased
+
+from .base import HandlerAPI
+
+
+class HandlerAPIModel(HandlerAPI):
+    """Read-only JSON listing of a model
+    GET /api/<model>?after=<id>&limit=<n>&fields=name,drink.name
+    Pages by id (keyset, no OFFSET): pass the "next" of a response as "after" to get the following page.
+    Only the requested columns are selected, "relation.column" fields are joined in the same query."""
+
+    model_name: str = None
+    fields_default: typing.List[str] = ["id"]
+    limit_default: int = 100
+    limit_max: int = 1000
+    size_chunk: int = 100  # Rows per flushed chunk of the response
+
+    @property
+    def model(self) -> type:
+        # Imported here so the web package can load without a database
+        from ...database import Base
+
+        return Base._decl_class_registry[self.model_name]
+
+    def resolve_fields(self, fields: typing.List[str]) -> typing.Tuple[list, dict]:
+        "Columns to select for the fields, and {relation: alias} to join"
+        mapper = sa.inspect(self.model)
+        columns, aliases = [], {}
+        for name_field in fields:
+            relation, _, name = name_field.rpartition(".")
+            if not relation:
+                mapper_target, target = mapper, self.model
+            elif relation in mapper.relationships:
+                # The alias is only for the select, an AliasedInsp has no columns to check
+                mapper_target = mapper.relationships[relation].mapper
+                target = aliases.setdefault(relation, aliased(mapper_target.class_))
+            else:
+                raise tornado.web.HTTPError(400, f"Unknown relation {relation !r}")
+
+            if name not in mapper_target.columns:
+                raise tornado.web.HTTPError(400, f"Unknown field {name_field !r}")
+            columns.append(getattr(target, name))
+        return columns, aliases
+
+    def fetch(self, session, columns: list, aliases: dict, after: int, limit: int) -> list:
+        query = session.query(*columns)
+        for relation, alias in aliases.items():
+            query = query.outerjoin(alias, getattr(self.model, relation))
+        return (
+            query.filter(self.model.id > after)
+            .order_by(self.model.id)
+            .limit(limit)
+            .all()
+        )
+
+    async def get(self, *args, **kwargs):
+        try:
+            after = int(self.get_argument("after", 0))
+            limit = min(int(self.get_argument("limit", self.limit_default)), self.limit_max)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "after and limit must be integers")
+        if limit < 1:
+            raise tornado.web.HTTPError(400, "limit must be at least 1")
+
+        fields = self.get_argument("fields", None)
+        fields = fields.split(",") if fields else self.fields_default
+        if "id" not in fields:
+            # Needed for the cursor
+            fields = ["id", *fields]
+
+        columns, aliases = self.resolve_fields(fields)
+        rows = await self.run_db(self.fetch, columns, aliases, after, limit)
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write('{"data":[')
+        for i in range(0, len(rows), self.size_chunk):
+            self.write(
+                ("," if i else "")
+                + ",".join(
+                    json.dumps(dict(zip(fields, row)), default=str)
+                    for row in rows[i : i + self.size_chunk]
+                )
+            )
+            await self.flush()
+
+        cursor = rows[-1][fields.index("id")] if rows and len(rows) == limit else None
+        self.finish(f'],"next":{json.dumps(cursor)}}}')
+
+
+class API_Drink(HandlerAPIModel):
+    model_name = "Drink"
+    fields_default = ["id", "name"]
+
+
+class API_DrinkNameAlt(HandlerAPIModel):
+    model_name = "DrinkNameAlt"
+    fields_default = ["id", "name", "drinkId"]
+
+
+class API_Ingredient(HandlerAPIModel):
+    model_name = "Ingredient"
+    fields_default = ["id", "name", "ingredient_parentId"]
+
+
+class API_DrinkIngredient(HandlerAPIModel):
+    model_name = "DrinkIngredient"
+    fields_default = ["id", "drinkId", "ingredientId", "drink.name", "ingredient.name"]
@@ -18,8 +18,8 @@ from tornado import gen
 from tornado.ioloop import IOLoop, PeriodicCallback
 
 from ...core.console import output
-from ..constants import PATH_TEMPLATES
-from ..helpers import get_path_from_name
+from ...core.metrics import METRICS, REQUEST_STATS, RequestStats
+from ..templates import TEMPLATES_PAGE
 
 _debug = True
 
@@ -29,17 +29,56 @@ class HandlerWebsocket(tornado.websocket.WebSocketHandler):
 
     count = 0
 
+    def initialize(self):
+        self.user = None
+        self.topics = set()
+
+    @classmethod
+    def localUrl(cls):
+        return "/websocket"
+
     @gen.coroutine
     def open(self):
-        self.application.addWebsocket(self)
-        output(source=self, message="WebSocket opened [_]")
-        self.chirp()
+        self.application.add_websocket(self, user=self.current_user)
+        self.timeOpened = time.monotonic()
+        output(
+            source=self,
+            message="WebSocket opened [_]",
+            fields={
+                "user": self.current_user,
+                "ip": self.request.remote_ip,
+                "websockets": len(self.application.hub.websockets),
+            },
+        )
+        # Through the hub, so the first chirp counts as inflight like any other
+        self.application.hub.send(self)
 
-    @gen.coroutine
     def chirp(self):
+        """Send message to client to update.
+        Returns the future of the write, so the hub can tell slow clients apart"""
         output(source=self, message="CAW")
-        """Send message to client to update."""
-        self.write_message("chirp")
+        return self.write_message("chirp")
+
+    def on_message(self, message):
+        'Clients follow records with {"subscribe": ["Drink:12"]} and {"unsubscribe": [...]}'
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+
+        def get_topics(key: str) -> list:
+            # Only lists of strings, a bare string would subscribe each of its characters
+            topics = data.get(key, [])
+            if isinstance(topics, list) and all(isinstance(t, str) for t in topics):
+                return topics
+            return []
+
+        for topic in get_topics("subscribe"):
+            self.application.hub.subscribe(self, topic)
+        for topic in get_topics("unsubscribe"):
+            self.application.hub.unsubscribe(self, topic)
 
     # @gen.coroutine
     # def on_message(self, message):
@@ -52,7 +91,20 @@ class HandlerWebsocket(tornado.websocket.WebSocketHandler):
     #     return self.send(self.application.parse(cargo, self))
 
     def on_close(self):
-        output(source=self, message="WebSocket closed [X]")
+        self.application.hub.remove(self)
+        output(
+            source=self,
+            message="WebSocket closed [X]",
+            fields={
+                "user": self.user,
+                "code": self.close_code,
+                "seconds": round(
+                    time.monotonic() - getattr(self, "timeOpened", time.monotonic()), 3
+                ),
+                "topics": len(self.topics),
+                "websockets": len(self.application.hub.websockets),
+            },
+        )
 
     # @gen.coroutine
     # def send(self, cargo):
@@ -72,10 +124,7 @@ class HandlerPage(tornado.web.RequestHandler):
     def get(self, *args, **kwargs):
 
         self.render(
-            get_path_from_name(
-                name="_".join(self.__class__.__name__.split("_")[1:]),
-                path=PATH_TEMPLATES,
-            ).name
+            TEMPLATES_PAGE.relative("_".join(self.__class__.__name__.split("_")[1:]))
         )
 
     @classmethod
@@ -105,10 +154,38 @@ class HandlerPage(tornado.web.RequestHandler):
         #     ModelHandler()
         # )  # TODO: Add ip or some identifying factor to the start of the ModelHandler object
         self.error = None
+        self.stats = None
+
+    def prepare(self):
+        "Start timing, queries run for this request are counted into self.stats"
+        self.timeStart = time.perf_counter()
+        self.stats = RequestStats(handler=self.__class__.__name__)
+        # Set within the request's own task, so other requests do not see it
+        REQUEST_STATS.set(self.stats)
+
+    def on_finish(self):
+        if getattr(self, "timeStart", None) is None:
+            # Failed before prepare (ex: unsupported method)
+            return
+        METRICS.observe_request(
+            handler=self.__class__.__name__,
+            method=self.request.method,
+            status=self.get_status(),
+            seconds=time.perf_counter() - self.timeStart,
+            stats=self.stats,
+        )
 
-    @gen.coroutine
-    def chirp(self):
-        return self.application.chirp(self.user)
+    def chirp(self, topics=()):
+        return self.application.chirp(user=self.current_user, topics=topics)
+
+    @property
+    def source(self):
+        return self.application.get_source()
+
+    async def run_db(self, fn, *args, **kwargs):
+        """Await fn(session, *args, **kwargs) without stalling the IOLoop,
+        ex: drinks = await self.run_db(lambda session: session.query(Drink).all())"""
+        return await self.source.run(fn, *args, **kwargs)
 
 
 class HandlerAPI(HandlerPage):
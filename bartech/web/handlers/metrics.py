@@ -0,0 +1,15 @@
+from ...core.metrics import METRICS
+from .base import HandlerPage
+
+
+class HandlerMetrics(HandlerPage):
+    """Prometheus scrape endpoint: request latency, queries per request, N+1 suspects
+    and query durations per source, see core.metrics"""
+
+    @classmethod
+    def localUrl(cls):
+        return "/metrics"
+
+    def get(self, *args, **kwargs):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(METRICS.render())
@@ -0,0 +1,138 @@
+"Registry of open websockets, so a chirp only touches the sockets that need it"
+import typing
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+
+from ..core.console import output
+
+
+def get_topic(model, id: int) -> str:
+    "Topic name for one record, ex: get_topic(Drink, 12) -> 'Drink:12'"
+    return f"{getattr(model, '__name__', model)}:{id}"
+
+
+@dataclass
+class WebsocketHub:
+    """Websockets indexed by user and by topic.
+    Chirps are collected for `window` seconds and each socket gets at most one per window.
+    A socket that still has `inflight_max` chirps unwritten is skipped (the pending chirp
+    already tells it to refresh), and after `drops_max` skips in a row it is closed."""
+
+    window: float = 0.05
+    inflight_max: int = 1
+    drops_max: int = 50
+
+    websockets: set = field(default_factory=set)
+    byUser: typing.DefaultDict[object, set] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+    byTopic: typing.DefaultDict[str, set] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+
+    inflight: dict = field(default_factory=dict)
+    drops: dict = field(default_factory=dict)
+    pending: set = field(default_factory=set)
+    _isScheduled: bool = False
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__}(websockets={len(self.websockets)} "
+            f"users={len(self.byUser)} topics={len(self.byTopic)})>"
+        )
+
+    def add(self, websocket, user=None):
+        self.websockets.add(websocket)
+        self.inflight[websocket] = 0
+        self.drops[websocket] = 0
+        if user is not None:
+            websocket.user = user
+            self.byUser[user].add(websocket)
+
+    def remove(self, websocket):
+        self.websockets.discard(websocket)
+        self.pending.discard(websocket)
+        self.inflight.pop(websocket, None)
+        self.drops.pop(websocket, None)
+
+        user = getattr(websocket, "user", None)
+        if user is not None:
+            self._discard(self.byUser, user, websocket)
+        for topic in list(getattr(websocket, "topics", ())):
+            self._discard(self.byTopic, topic, websocket)
+
+    def subscribe(self, websocket, topic: str):
+        websocket.topics.add(topic)
+        self.byTopic[topic].add(websocket)
+
+    def unsubscribe(self, websocket, topic: str):
+        websocket.topics.discard(topic)
+        self._discard(self.byTopic, topic, websocket)
+
+    @staticmethod
+    def _discard(index: dict, key, websocket):
+        "Remove from an index, dropping the key once nobody is left"
+        sockets = index.get(key)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del index[key]
+
+    def chirp(self, user=None, topics: typing.Iterable[str] = ()):
+        "Queue a chirp for the user's sockets and the topics' subscribers, O(recipients)"
+        self.pending.update(self.byUser.get(user, ()))
+        for topic in topics:
+            self.pending.update(self.byTopic.get(topic, ()))
+        self.schedule()
+
+    def chirp_all(self):
+        self.pending.update(self.websockets)
+        self.schedule()
+
+    def schedule(self):
+        if self.pending and not self._isScheduled:
+            self._isScheduled = True
+            IOLoop.current().call_later(self.window, self.flush)
+
+    def flush(self):
+        "Send the chirps collected during the window"
+        self._isScheduled = False
+        pending, self.pending = self.pending, set()
+        for websocket in pending:
+            self.send(websocket)
+
+    def send(self, websocket) -> bool:
+        """Chirp one socket now, counted against inflight_max and drops_max like the windowed
+        chirps, returns whether it was sent"""
+        if websocket not in self.websockets:
+            return False
+
+        if self.inflight[websocket] >= self.inflight_max:
+            self.drops[websocket] += 1
+            if self.drops[websocket] >= self.drops_max:
+                output(
+                    source=self,
+                    message=f"Closing slow websocket {websocket !r}",
+                    option_status="CAUTION",
+                )
+                self.remove(websocket)
+                websocket.close()
+            return False
+
+        self.drops[websocket] = 0
+        try:
+            future = websocket.chirp()
+        except WebSocketClosedError:
+            self.remove(websocket)
+            return False
+
+        self.inflight[websocket] += 1
+        future.add_done_callback(lambda _, ws=websocket: self._written(ws))
+        return True
+
+    def _written(self, websocket):
+        if websocket in self.inflight:
+            self.inflight[websocket] -= 1
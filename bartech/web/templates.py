@@ -0,0 +1,67 @@
+"Templates discovered once at startup, so rendering a page never lists a directory"
+import re
+import typing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import tornado.autoreload
+import tornado.template
+
+from .constants import PATH_TEMPLATES
+
+
+@dataclass
+class TemplateRegistry:
+    """Template files in `path` by name (the file name up to the first dot, ex: notFound)
+    Lookups are case insensitive like get_path_from_name, names are given relative to `root`
+    (the tornado template_path)"""
+
+    path: Path
+    root: Path = PATH_TEMPLATES
+
+    templates: typing.Dict[str, Path] = field(default_factory=dict)
+    _lower: typing.Dict[str, Path] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self.discover()
+
+    def discover(self):
+        self.templates, self._lower = {}, {}
+        for pth in sorted(self.path.iterdir()):
+            if pth.is_dir() or not re.search(r"\.html(?:\.j2)?", pth.name, re.IGNORECASE):
+                continue
+            name = pth.name.split(".")[0]
+            if name.lower() in self._lower:
+                raise AssertionError(
+                    f"Multiple template files found for {name}: {[self[name], pth]}"
+                )
+            self.templates[name] = self._lower[name.lower()] = pth
+
+    def __getitem__(self, name: str) -> Path:
+        try:
+            return self._lower[name.lower()]
+        except KeyError:
+            raise AssertionError(f"No template files found for {name}")
+
+    def __iter__(self):
+        return iter(self.templates.items())
+
+    def relative(self, name: str) -> str:
+        "Template name to hand to RequestHandler.render / render_string"
+        return self[name].relative_to(self.root).as_posix()
+
+    def compile(self, loader: tornado.template.Loader):
+        "Load every template into the loader's cache, so the first request is already compiled"
+        for name in self.templates:
+            loader.load(self.relative(name))
+
+    def watch(self):
+        """Restart on changes when autoreload is on (debug), which rebuilds the registry.
+        Directories are watched too, their mtime changes when a template is added or removed"""
+        tornado.autoreload.watch(str(self.path))
+        for pth in self.templates.values():
+            tornado.autoreload.watch(str(pth))
+
+
+TEMPLATES_PAGE = TemplateRegistry(path=PATH_TEMPLATES)
+TEMPLATES_UI = TemplateRegistry(path=PATH_TEMPLATES / "ui")
@@ -0,0 +1,48 @@
+"Output transforms (response body encodings) for AppWeb"
+import tornado.web
+from tornado.escape import _unicode
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class BrotliContentEncoding(tornado.web.GZipContentEncoding):
+    """Brotli counterpart of tornado's GZipContentEncoding, for clients that accept "br".
+    Put it before GZipContentEncoding, which leaves responses that already have a
+    Content-Encoding alone (and adds the Vary header for both).
+    Does nothing if the brotli package is not installed."""
+
+    QUALITY = 5  # Streaming responses, favour speed over ratio
+
+    def __init__(self, request):
+        self._gzipping = brotli is not None and "br" in request.headers.get(
+            "Accept-Encoding", ""
+        )
+
+    def transform_first_chunk(self, status_code, headers, chunk, finishing):
+        if self._gzipping:
+            ctype = _unicode(headers.get("Content-Type", "")).split(";")[0]
+            self._gzipping = (
+                self._compressible_type(ctype)
+                and (not finishing or len(chunk) >= self.MIN_LENGTH)
+                and ("Content-Encoding" not in headers)
+            )
+        if self._gzipping:
+            headers["Content-Encoding"] = "br"
+            self._compressor = brotli.Compressor(quality=self.QUALITY)
+            chunk = self.transform_chunk(chunk, finishing)
+            if "Content-Length" in headers:
+                if finishing:
+                    headers["Content-Length"] = str(len(chunk))
+                else:
+                    del headers["Content-Length"]
+        return status_code, headers, chunk
+
+    def transform_chunk(self, chunk, finishing):
+        if self._gzipping:
+            chunk = self._compressor.process(chunk) + (
+                self._compressor.finish() if finishing else self._compressor.flush()
+            )
+        return chunk
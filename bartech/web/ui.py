@@ -7,8 +7,7 @@ from tornado.web import UIModule
 
 # from dataclasses import dataclass
 
-from .helpers import get_path_from_name
-from .constants import PATH_TEMPLATES
+from .templates import TEMPLATES_UI
 from ..core.console import output
 
 
@@ -22,12 +21,7 @@ class HandlerUI(UIModule):
     def render(self):
         self.id = str(uuid.uuid4()).replace("-", "")
 
-        return self.render_string(
-            get_path_from_name(
-                name=self.__class__.title(), path=PATH_TEMPLATES / "ui"
-            ).name,
-            ui=self,
-        )
+        return self.render_string(TEMPLATES_UI.relative(self.__class__.title()), ui=self)
 
     @classmethod
     def title(cls):
@@ -35,14 +29,9 @@ class HandlerUI(UIModule):
 
 
 # NOTE: SECTION -> DYNAMICALLY CREATED UIs
-for path_template in [
-    x
-    for x in (PATH_TEMPLATES / "ui").iterdir()
-    if (not x.is_dir() and re.search(r"\.html(?:\.j2)?", x.name, re.IGNORECASE))
-]:
+for name_path_template, path_template in TEMPLATES_UI:
     # Dont worry about not including some, everything is controlled by the PH anyway
     # if not re.search("(old|new|_?test_?|_$)", f.stem, re.IGNORECASE):
-    name_path_template = path_template.name.split(".")[0]
 
     # TODO: Add __admin for admin-only pages, add __auth for authenticated-only pages
 
@@ -0,0 +1,78 @@
+"""Contention benchmark for the keyed locks used by Model.get_or_create
+
+Run from the repository root:
+    python -m benchmarks.bench_locks
+"""
+import random
+import time
+from threading import Barrier, Thread
+
+from bartech.core.locks import KeyedLock, SLock
+
+THREADS = [1, 8, 64]
+OPERATIONS = 50_000  # Total acquire/release pairs per run, split across threads
+KEYS = 10_000  # Size of the key space, like distinct filters during an ingest
+HELD = 1_000  # Keys held by a background thread for the whole run (live entries)
+
+
+def work(lock, keys, barrier):
+    barrier.wait()
+    for key in keys:
+        with lock[key]:
+            pass
+
+
+def hold(lock, keys, barrier, barrier_done):
+    handles = []
+    for key in keys:
+        # Enter straight away, SLock sweeps entries that nobody waits on yet
+        handles.append(lock[key])
+        handles[-1].__enter__()
+    barrier.wait()
+    barrier_done.wait()
+    [h.__exit__(None, None, None) for h in handles]
+
+
+def run(lock, threads: int) -> float:
+    rand = random.Random(threads)
+    per_thread = OPERATIONS // threads
+    barrier = Barrier(threads + 2)
+    barrier_done = Barrier(2)
+
+    holder = Thread(
+        target=hold,
+        args=(lock, [("held", i) for i in range(HELD)], barrier, barrier_done),
+    )
+    workers = [
+        Thread(
+            target=work,
+            args=(
+                lock,
+                [("key", rand.randrange(KEYS)) for _ in range(per_thread)],
+                barrier,
+            ),
+        )
+        for _ in range(threads)
+    ]
+    holder.start()
+    [w.start() for w in workers]
+
+    barrier.wait()
+    start = time.perf_counter()
+    [w.join() for w in workers]
+    elapsed = time.perf_counter() - start
+
+    barrier_done.wait()
+    holder.join()
+    return per_thread * threads / elapsed
+
+
+def main():
+    print(f"{'lock':>10} {'threads':>8} {'ops/s':>12}")
+    for threads in THREADS:
+        for cls in [SLock, KeyedLock]:
+            print(f"{cls.__name__:>10} {threads:>8} {run(cls(), threads):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Requests per second for / with AppWeb in debug and production mode
+
+Run from the repository root (each mode is served from its own process):
+    python -m benchmarks.bench_web
+
+Status codes are counted apart from the timings, which only cover the 200 responses.
+"""
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from tornado.httpclient import AsyncHTTPClient
+
+MODES = ["debug", "production"]
+PORT = 8765
+PATH = "/"
+REQUESTS = 2_000
+CONCURRENCY = 20
+HEADERS = {"Accept-Encoding": "br, gzip"}
+
+
+def serve(mode: str, port: int):
+    from bartech.web import AppWeb
+
+    AppWeb(mode=mode).serve(port=port)
+
+
+async def fetch(client, url: str):
+    # Error statuses are returned, not raised, so they are counted rather than retried
+    return await client.fetch(
+        url, headers=HEADERS, raise_error=False, decompress_response=False
+    )
+
+
+async def wait_ready(client, url: str, timeout: float = 30):
+    "First response once the server accepts connections, whatever its status"
+    timeEnd = time.monotonic() + timeout
+    while True:
+        try:
+            response = await fetch(client, url)
+        except (ConnectionError, OSError):
+            response = None
+        if response is not None and response.code != 599:
+            # 599 is the client's own connection failure
+            return response
+        if time.monotonic() > timeEnd:
+            raise TimeoutError(f"{url} not reachable after {timeout}s")
+        await asyncio.sleep(0.2)
+
+
+async def hammer(url: str) -> dict:
+    client = AsyncHTTPClient(max_clients=CONCURRENCY)
+    first = await wait_ready(client, url)
+    remaining = iter(range(REQUESTS))
+    codes, latencies = Counter(), []
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await fetch(client, url)
+            codes[response.code] += 1
+            if response.code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - start
+    return {
+        "codes": codes,
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else None,
+        "encoding": first.headers.get("Content-Encoding", "identity"),
+    }
+
+
+def main():
+    print(f"{'mode':>12} {'ok/s':>10} {'p50 ms':>8} {'encoding':>10}  codes")
+    for mode in MODES:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_web", "--serve", mode, str(PORT)],
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            result = asyncio.run(hammer(f"http://127.0.0.1:{PORT}{PATH}"))
+        finally:
+            process.terminate()
+            process.wait()
+
+        p50 = f"{result['p50'] * 1000:8.2f}" if result["p50"] is not None else f"{'-':>8}"
+        print(
+            f"{mode:>12} {result['rps']:>10,.0f} {p50} {result['encoding']:>10}  "
+            f"{dict(result['codes'])}"
+        )
+        if set(result["codes"]) != {200}:
+            print(f"{'':>12} WARNING: non 200 responses, the timings only cover the 200s")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(mode=sys.argv[2], port=int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,43 @@
+"""Tests run from a scratch directory: config.yaml (MAIN on a SQLite file) and an empty
+secrets.yaml are written there, src, static and data link back to the repository"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+PATH_REPO = Path(__file__).resolve().parent.parent
+PATH_RUN = Path(tempfile.mkdtemp(prefix="bartech-tests-"))
+
+with open(PATH_REPO / "config.yaml", "r") as fh:
+    config = yaml.load(fh, Loader=yaml.FullLoader)
+config["connections"]["templates"]["_sqlite"] = "sqlite:///{database}"
+config["connections"]["sources"] = {
+    "MAIN": {
+        "template": "_sqlite",
+        "server": "localhost",
+        "database": str(PATH_RUN / "bartech.db"),
+    }
+}
+with open(PATH_RUN / "config.yaml", "w") as fh:
+    yaml.dump(config, fh)
+with open(PATH_RUN / "secrets.yaml", "w") as fh:
+    yaml.dump({"connections": {"MAIN": {}}}, fh)
+for name in ["src", "static", "data"]:
+    (PATH_RUN / name).symlink_to(PATH_REPO / name)
+
+# Modules read config.yaml and the template folders relative to the working directory on import
+os.chdir(PATH_RUN)
+sys.path.insert(0, str(PATH_REPO))
+
+
+def reset_database():
+    "MAIN source with every table dropped and created again"
+    from bartech.database import Base, Source
+
+    source = Source.sources.get("MAIN") or Source.from_name("MAIN")
+    source.session.rollback()
+    Base.metadata.drop_all(source.engine)
+    Base.metadata.create_all(source.engine)
+    return source
@@ -0,0 +1,48 @@
+import json
+
+from tornado.testing import AsyncHTTPTestCase
+
+from conftest import reset_database
+
+
+class TestAPIModel(AsyncHTTPTestCase):
+    def get_app(self):
+        from bartech.web.app import AppWeb
+
+        return AppWeb(mode="debug")
+
+    def setUp(self):
+        from bartech.database.models import Drink, DrinkIngredient, Ingredient
+
+        source = reset_database()
+        session = source.Session()
+        drink, ingredient = Drink(name="Mojito"), Ingredient(name="Rum")
+        session.add_all([drink, ingredient])
+        session.flush()
+        session.add(DrinkIngredient(drinkId=drink.id, ingredientId=ingredient.id))
+        session.commit()
+        session.close()
+        super().setUp()
+
+    def get_json(self, url: str) -> dict:
+        response = self.fetch(url)
+        self.assertEqual(response.code, 200, response.body)
+        return json.loads(response.body)
+
+    def test_dotted_fields(self):
+        body = self.get_json("/api/drinkingredient?fields=drink.name,ingredient.name")
+        self.assertEqual(
+            body["data"], [{"id": 1, "drink.name": "Mojito", "ingredient.name": "Rum"}]
+        )
+
+    def test_default_fields(self):
+        body = self.get_json("/api/drinkingredient")
+        self.assertEqual(body["data"][0]["drink.name"], "Mojito")
+
+    def test_unknown_field(self):
+        self.assertEqual(self.fetch("/api/drinkingredient?fields=drink.nope").code, 400)
+
+    def test_limit(self):
+        self.assertEqual(self.fetch("/api/drink?limit=0").code, 400)
+        self.assertEqual(self.get_json("/api/drink?limit=1")["next"], 1)
+        self.assertEqual(self.get_json("/api/drink?after=1")["data"], [])
@@ -0,0 +1,55 @@
+import pytest
+import sqlalchemy as sa
+
+from conftest import reset_database
+
+# Past SQLite's default limit of 999 bound parameters
+COUNT = 1_200
+
+
+@pytest.fixture
+def source():
+    source = reset_database()
+    yield source
+    source.session.rollback()
+
+
+@pytest.fixture
+def sizes_in(source):
+    "Number of bound parameters of every SELECT ... IN run on the source"
+    sizes = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and " IN (" in statement:
+            sizes.append(len(parameters))
+
+    sa.event.listen(source.engine, "before_cursor_execute", before_cursor_execute)
+    yield sizes
+    sa.event.remove(source.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_get_or_create_many_chunks_in(source, sizes_in):
+    from bartech.database.models import Drink
+
+    names = [f"Drink {i}" for i in range(COUNT)]
+    drinks = Drink.get_or_create_many(
+        source, [{"name": name} for name in names], size_chunk=COUNT
+    )
+
+    assert [d.name for d in drinks] == names
+    assert sizes_in and max(sizes_in) <= Drink._sizeIn
+
+
+def test_create_all_chunks_prefetch(monkeypatch, source, sizes_in):
+    from bartech.database.models import Drink, DrinkNameAlt
+
+    names = [f"Drink {i}" for i in range(COUNT)]
+    Drink.get_or_create_many(source, [{"name": name} for name in names])
+    sizes_in.clear()
+
+    monkeypatch.setattr(DrinkNameAlt, "_data_header", ["name", "Drink name"], raising=False)
+    monkeypatch.setattr(DrinkNameAlt, "_data", [[f"Alt {n}", n] for n in names])
+    alts = DrinkNameAlt.createAll(source.session)
+
+    assert [(a.name, a.drink.name) for a in alts] == [(f"Alt {n}", n) for n in names]
+    assert sizes_in and max(sizes_in) <= DrinkNameAlt._sizeIn
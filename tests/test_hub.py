@@ -0,0 +1,37 @@
+import json
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.websocket import websocket_connect
+
+
+class TestWebsocketHub(AsyncHTTPTestCase):
+    def get_app(self):
+        from bartech.web.app import AppWeb
+
+        return AppWeb(mode="debug")
+
+    @gen_test
+    async def test_open_chirps_through_hub(self):
+        hub = self._app.hub
+        connection = await websocket_connect(self.get_url("/websocket").replace("http", "ws"))
+        self.assertEqual(await connection.read_message(), "chirp")
+        self.assertEqual(len(hub.websockets), 1)
+        # The first chirp went through hub.send and was accounted for
+        (websocket,) = hub.websockets
+        self.assertEqual(hub.inflight[websocket], 0)
+
+        connection.write_message(json.dumps({"subscribe": ["Drink:1"]}))
+        connection.write_message(json.dumps({"subscribe": "Drink:2"}))
+        connection.write_message(json.dumps([1]))
+        connection.write_message(json.dumps({"subscribe": ["Drink:3"]}))
+        while "Drink:3" not in hub.byTopic:
+            await self.io_loop.run_in_executor(None, lambda: None)
+        self.assertEqual(set(hub.byTopic), {"Drink:1", "Drink:3"})
+
+        hub.chirp(topics=["Drink:1"])
+        self.assertEqual(await connection.read_message(), "chirp")
+
+        connection.close()
+        while hub.websockets:
+            await self.io_loop.run_in_executor(None, lambda: None)
+        self.assertEqual(dict(hub.byTopic), {})
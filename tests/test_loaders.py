@@ -0,0 +1,60 @@
+import pytest
+import yaml
+
+from conftest import reset_database
+
+RECIPES_YAML = """\
+---
+Highball:
+    category: highball
+    notes: |
+        Build over ice.
+
+        Top with ginger ale.
+    ingredients:
+        whiskey: 1
+        gingerale: 2
+
+# Comment between entries
+Old Fashioned:
+    category: lowball
+    notes: >
+        Stir,
+
+        then strain.
+    ingredients:
+        whiskey: 2
+"""
+
+
+def test_iter_recipes_yaml_blank_lines(tmp_path):
+    from bartech.database.loaders import iter_recipes
+
+    path = tmp_path / "recipes.yaml"
+    path.write_text(RECIPES_YAML)
+
+    assert dict(iter_recipes(path)) == yaml.safe_load(RECIPES_YAML)
+
+
+def test_get_id_none():
+    from bartech.database.loaders import get_id
+
+    assert get_id(None) is None
+
+
+def test_load_batch_uncreated_ingredient(monkeypatch):
+    from bartech.database.loaders import RecipeLoader
+    from bartech.database.models import Ingredient
+
+    source = reset_database()
+    # As get_or_create_many returns for rows it could not create
+    monkeypatch.setattr(
+        Ingredient,
+        "get_or_create_many",
+        classmethod(lambda cls, requestor, list_filters, **kwargs: [None] * len(list_filters)),
+    )
+
+    with pytest.raises(Exception, match="'whiskey' of recipe 'Highball'"):
+        RecipeLoader(requestor=source).load_batch(
+            [("Highball", {"ingredients": {"whiskey": 1}})]
+        )
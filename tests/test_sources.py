@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from conftest import reset_database
+
+
+def get_or_create_twice(source):
+    from bartech.database.models import Drink
+
+    async def main():
+        created = await Drink.get_or_create_async(
+            source, filters={"name": "Mojito"}, updates={"category": "Classic"}
+        )
+        found = await Drink.get_or_create_async(
+            source, filters={"name": "Mojito"}, updates={"category": "Highball"}
+        )
+        return created, found
+
+    return asyncio.run(main())
+
+
+def assert_created_once(source, created, found):
+    from bartech.database.models import Drink
+
+    assert created.id == found.id
+    assert created.category == "Classic"
+    assert found.category == "Highball"
+    session = source.Session()
+    assert [(d.name, d.category) for d in session.query(Drink)] == [("Mojito", "Highball")]
+    session.close()
+
+
+def test_get_or_create_async_executor(monkeypatch):
+    from bartech.database import sources
+
+    source = reset_database()
+    # Thread pool path, as without an asyncio driver
+    monkeypatch.setattr(sources, "create_async_engine", None)
+    monkeypatch.setattr(source, "_engine_async", None)
+    assert source.engine_async is None
+
+    created, found = get_or_create_twice(source)
+    assert_created_once(source, created, found)
+
+
+def test_get_or_create_async_engine():
+    from bartech.database import sources
+
+    if sources.create_async_engine is None:
+        pytest.skip("SQLAlchemy without asyncio support")
+    pytest.importorskip("aiosqlite")
+
+    source = reset_database()
+    assert source.engine_async is not None
+
+    created, found = get_or_create_twice(source)
+    assert_created_once(source, created, found)
+
+
+def test_pool_waits_every_checkout():
+    source = reset_database()
+    before = (source.stats.checkouts, source.stats.waits)
+    for session in [source.Session(), source.session_scoped()]:
+        session.execute("SELECT 1")
+        session.close()
+    source.session_scoped.remove()
+    with source.connection_scope() as connection:
+        connection.execute("SELECT 1")
+
+    checkouts, waits = source.stats.checkouts - before[0], source.stats.waits - before[1]
+    assert checkouts == waits == 3
+    assert source.pool_status["waitMax"] >= 0